@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к БД на каждом обращении.
+
+    Токен вместе с пользователем хранится в общем кеше Django
+    (TOKEN_CACHE_TIMEOUT) и в небольшом кеше процесса
+    (TOKEN_CACHE_LOCAL_TIMEOUT). Записи сбрасываются сигналами при выходе,
+    смене пароля и деактивации пользователя; в других процессах
+    локальная запись живёт не дольше TOKEN_CACHE_LOCAL_TIMEOUT.
+    """
+
+    local_size = 10000
+    _local = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(key):
+        return f'auth:token:{key}'
+
+    @classmethod
+    def invalidate(cls, key):
+        with cls._lock:
+            cls._local.pop(key, None)
+        cache.delete(cls.cache_key(key))
+
+    def get_local(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires, token = entry
+            if expires < time.monotonic():
+                del self._local[key]
+                return None
+            return token
+
+    def set_local(self, key, token):
+        with self._lock:
+            self._local[key] = (
+                time.monotonic() + settings.TOKEN_CACHE_LOCAL_TIMEOUT, token
+            )
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def authenticate_credentials(self, key):
+        token = self.get_local(key) or cache.get(self.cache_key(key))
+        if token is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(
+                self.cache_key(key), token, settings.TOKEN_CACHE_TIMEOUT
+            )
+        elif not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        self.set_local(key, token)
+        return token.user, token
@@ -0,0 +1,200 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from foodgram.routers import read_from_primary
+
+
+def get_version(key):
+    """Версия по ключу общего кеша — время последнего изменения в мс."""
+    version = cache.get(key)
+    if version is None:
+        version = int(time.time() * 1000)
+        cache.add(key, version, settings.CACHE_VERSION_TIMEOUT)
+        version = cache.get(key) or version
+    return version
+
+
+def bump_version(key):
+    version = max(int(time.time() * 1000), (cache.get(key) or 0) + 1)
+    cache.set(key, version, settings.CACHE_VERSION_TIMEOUT)
+
+
+def changed_recently(version):
+    """Изменение с версией version могло ещё не дойти до реплик."""
+    return time.time() - version / 1000 < settings.REPLICA_PIN_SECONDS
+
+
+def read_fresh(*versions):
+    """Чтение ответа, который получит ETag версий versions.
+
+    Пока последнее изменение может быть не на реплике, ответ читается из
+    default: иначе старые данные закрепились бы за новым ETag.
+    """
+    if changed_recently(max(versions)):
+        return read_from_primary()
+    return nullcontext()
+
+
+class CatalogCache:
+    """Версионируемый кеш справочника (теги, ингредиенты).
+
+    Версия справочника хранится в общем кеше Django и меняется сигналами
+    при любом изменении записей. Ответы хранятся в LRU-кеше процесса
+    с ключом (версия, запрос), поэтому устаревшие записи просто вытесняются.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.version_key = f'catalog:{name}:version'
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def version(self):
+        return get_version(self.version_key)
+
+    def invalidate(self, **kwargs):
+        bump_version(self.version_key)
+
+    def get_or_build(self, key, version, build):
+        key = (version, key)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        value = build()
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > settings.CATALOG_CACHE_SIZE:
+                self._items.popitem(last=False)
+        return value
+
+
+tag_catalog = CatalogCache('tags')
+ingredient_catalog = CatalogCache('ingredients')
+
+
+RECIPES_VERSION_KEY = 'recipes:version'
+
+
+def recipes_version():
+    """Версия рецептов: меняется при добавлении, удалении и правке
+    рецепта, его тегов, ингредиентов, изображения или автора.
+    """
+    return get_version(RECIPES_VERSION_KEY)
+
+
+def bump_recipes_version():
+    bump_version(RECIPES_VERSION_KEY)
+
+
+def user_state_key(user_id):
+    return f'user:{user_id}:state:version'
+
+
+def user_state_version(user):
+    """Версия избранного, списка покупок и подписок пользователя."""
+    if user.is_anonymous:
+        return 0
+    return get_version(user_state_key(user.pk))
+
+
+def bump_user_state(user_id):
+    bump_version(user_state_key(user_id))
+
+
+class _Uncacheable(Exception):
+
+    def __init__(self, response):
+        self.response = response
+
+
+class CatalogCacheMixin:
+    """Отдаёт list/retrieve справочника из кеша с ETag и Last-Modified."""
+
+    catalog = None
+
+    def cached_response(self, request, build):
+        version = self.catalog.version()
+        etag = quote_etag(f'{self.catalog.name}-{version}')
+        last_modified = version // 1000
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = self._build_response(request, version, build)
+        if response.status_code in (
+            status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED
+        ):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def _build_response(self, request, version, build):
+        def build_data():
+            response = build()
+            if response.status_code != status.HTTP_200_OK:
+                raise _Uncacheable(response)
+            return response.data
+
+        try:
+            with read_fresh(version):
+                data = self.catalog.get_or_build(
+                    request.get_full_path(), version, build_data
+                )
+        except _Uncacheable as error:
+            return error.response
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CatalogCacheMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, lambda: super(CatalogCacheMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+
+class ConditionalGetMixin:
+    """ETag для ответов, зависящих от данных и состояния пользователя.
+
+    Представление передаёт version — время последнего изменения данных
+    ответа в мс; если ETag совпадает с If-None-Match, ответ 304 отдаётся
+    без сериализации.
+    """
+
+    def conditional_response(self, request, version, build):
+        versions = (
+            user_state_version(request.user),
+            tag_catalog.version(),
+            ingredient_catalog.version(),
+            version
+        )
+        etag = quote_etag(hashlib.md5(repr((
+            request.get_full_path(), request.user.pk, *versions
+        )).encode()).hexdigest())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            with read_fresh(*versions):
+                response = build()
+        if response.status_code in (
+            status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED
+        ):
+            response['ETag'] = etag
+            patch_vary_headers(response, ('Authorization',))
+        return response
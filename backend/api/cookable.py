@@ -0,0 +1,99 @@
+import threading
+from array import array
+from collections import Counter
+from datetime import timedelta
+
+from django.utils import timezone
+
+from recipes.models import Recipe, RecipeIngredient
+from .caching import bump_version, get_version
+
+
+class CookableIndex:
+    """Обратный индекс «ингредиент → рецепты» в памяти процесса.
+
+    Версия индекса хранится в общем кеше Django и меняется сигналами после
+    записи рецептов и их ингредиентов. При смене версии перечитываются
+    только рецепты, изменённые после прошлой загрузки, и убираются
+    удалённые; полностью индекс строится один раз.
+    """
+
+    version_key = 'recipes:ingredients:version'
+    # Запас на расхождение часов между процессами.
+    overlap = timedelta(minutes=1)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._loaded_at = None
+        self._ingredients = {}
+        self._postings = {}
+
+    def invalidate(self, **kwargs):
+        bump_version(self.version_key)
+
+    def _remove(self, recipe_id):
+        for ingredient_id in self._ingredients.pop(recipe_id, ()):
+            self._postings[ingredient_id] = array('L', (
+                pk for pk in self._postings[ingredient_id] if pk != recipe_id
+            ))
+
+    def _load(self):
+        version = get_version(self.version_key)
+        with self._lock:
+            if self._version == version:
+                return
+            started = timezone.now()
+            if self._loaded_at is None:
+                changed = list(Recipe.objects.values_list('pk', flat=True))
+                rows = RecipeIngredient.objects.all()
+            else:
+                existing = set(Recipe.objects.values_list('pk', flat=True))
+                for recipe_id in self._ingredients.keys() - existing:
+                    self._remove(recipe_id)
+                changed = list(Recipe.objects.filter(
+                    updated_at__gte=self._loaded_at - self.overlap
+                ).values_list('pk', flat=True))
+                for recipe_id in changed:
+                    self._remove(recipe_id)
+                rows = RecipeIngredient.objects.filter(
+                    recipe__updated_at__gte=self._loaded_at - self.overlap
+                )
+            ingredients = {recipe_id: [] for recipe_id in changed}
+            for recipe_id, ingredient_id in rows.values_list(
+                'recipe_id', 'ingredient_id'
+            ).iterator():
+                if recipe_id in ingredients:
+                    ingredients[recipe_id].append(ingredient_id)
+            for recipe_id, ingredient_ids in ingredients.items():
+                self._ingredients[recipe_id] = tuple(ingredient_ids)
+                for ingredient_id in ingredient_ids:
+                    self._postings.setdefault(
+                        ingredient_id, array('L')
+                    ).append(recipe_id)
+            self._loaded_at = started
+            self._version = version
+
+    def rank(self, ingredient_ids, max_missing=None):
+        """Рецепты, в которых есть хотя бы один из ingredient_ids.
+
+        Возвращает тройки (id рецепта, доля имеющихся ингредиентов,
+        число недостающих) от большей доли к меньшей, при равной доле —
+        от меньшего числа недостающих, затем от новых рецептов к старым.
+        """
+        self._load()
+        with self._lock:
+            have = Counter()
+            for ingredient_id in set(ingredient_ids):
+                have.update(self._postings.get(ingredient_id, ()))
+            ranked = []
+            for recipe_id, count in have.items():
+                total = len(self._ingredients[recipe_id])
+                missing = total - count
+                if max_missing is None or missing <= max_missing:
+                    ranked.append((recipe_id, count / total, missing))
+        ranked.sort(key=lambda item: (-item[1], item[2], -item[0]))
+        return ranked
+
+
+cookable_index = CookableIndex()
@@ -1,15 +1,80 @@
-import base64
+import binascii
+from tempfile import SpooledTemporaryFile
 
-from django.core.files.base import ContentFile
-from rest_framework.serializers import ImageField
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from rest_framework.serializers import Field, ImageField
+
+from recipes.images import variant_names
+
+BASE64_CHUNK_SIZE = 64 * 1024
 
 
 class Base64ImageField(ImageField):
 
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать {max_size} байт.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name=('temp.' + ext))
+            separator = data.index(';base64,')
+            ext = data[:separator].split('/')[-1]
+            data = self.decode(data, separator + len(';base64,'),
+                               'temp.' + ext)
 
         return super().to_internal_value(data)
+
+    def decode(self, data, start, name):
+        """Декодирует base64 с позиции start.
+
+        Строка один раз переводится в байты, дальше данные читаются через
+        memoryview без копий. Крупные изображения декодируются по частям
+        во временный файл, который при необходимости сбрасывается на диск.
+        """
+        size = (len(data) - start) * 3 // 4
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if size > max_size:
+            self.fail('too_large', max_size=max_size)
+        try:
+            encoded = memoryview(data.encode('ascii'))[start:]
+            if size <= settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+                return ContentFile(binascii.a2b_base64(encoded), name=name)
+            file = SpooledTemporaryFile(
+                max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+            )
+            for position in range(0, len(encoded), BASE64_CHUNK_SIZE):
+                file.write(binascii.a2b_base64(
+                    encoded[position:position + BASE64_CHUNK_SIZE]
+                ))
+        except (binascii.Error, UnicodeEncodeError):
+            self.fail('invalid_image')
+        file.seek(0)
+        return File(file, name=name)
+
+
+class ImageVariantsField(Field):
+    """Ссылки на уменьшенные копии изображения рецепта.
+
+    Возвращает None, пока копии не построены.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        kwargs.setdefault('source', 'image_hash')
+        super().__init__(**kwargs)
+
+    def to_representation(self, image_hash):
+        if not image_hash:
+            return None
+        request = self.context.get('request')
+        variants = {}
+        for size, names in variant_names(image_hash).items():
+            variants[size] = {}
+            for image_format, name in names.items():
+                url = default_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                variants[size][image_format] = url
+        return variants
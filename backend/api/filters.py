@@ -1,12 +1,92 @@
+import threading
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Value, When
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
+
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeTag,
+                            ShoppingCart, Tag)
+from recipes.search import search_recipes
+from .caching import ingredient_catalog
+
+
+class IngredientIndex:
+    """Отсортированный по названию индекс ингредиентов в памяти процесса.
+
+    Используется вместо индексов PostgreSQL на остальных СУБД.
+    Перестраивается при смене версии справочника ингредиентов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._keys = None
+        self._entries = None
+
+    def _load(self):
+        version = ingredient_catalog.version()
+        with self._lock:
+            if self._version != version:
+                rows = sorted(
+                    (name.casefold(), pk, name, measurement_unit)
+                    for pk, name, measurement_unit
+                    in Ingredient.objects.values_list(
+                        'pk', 'name', 'measurement_unit'
+                    )
+                )
+                self._keys = [row[0] for row in rows]
+                self._entries = rows
+                self._version = version
+            return self._keys, self._entries
+
+    def search(self, query, limit):
+        """Сначала совпадения по началу названия, затем по подстроке."""
+        keys, entries = self._load()
+        query = query.casefold()
+        found = []
+        start = bisect_left(keys, query)
+        for key, *row in entries[start:]:
+            if len(found) == limit or not key.startswith(query):
+                break
+            found.append(row)
+        if len(found) < limit:
+            for key, *row in entries:
+                if query in key and not key.startswith(query):
+                    found.append(row)
+                    if len(found) == limit:
+                        break
+        return [
+            Ingredient(pk=pk, name=name, measurement_unit=measurement_unit)
+            for pk, name, measurement_unit in found
+        ]
 
-from recipes.models import Recipe, Tag
 
+ingredient_index = IngredientIndex()
+
+
+class IngredientSearchFilter(BaseFilterBackend):
+    """Поиск ингредиентов для автодополнения в форме рецепта."""
 
-class IngredientSearchFilter(SearchFilter):
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query or view.action != 'list':
+            return queryset
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        if connection.vendor != 'postgresql':
+            return ingredient_index.search(query, limit)
+        return queryset.filter(name__icontains=query).annotate(
+            is_prefix=Case(
+                When(name__istartswith=query, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField()
+            )
+        ).order_by('is_prefix', 'name')[:limit]
+
 
 class FilterRecipe(filters.FilterSet):
 
@@ -15,24 +95,48 @@ class FilterRecipe(filters.FilterSet):
         field_name='tags__slug',
         queryset=Tag.objects.all(),
         label='Tags',
-        to_field_name='slug'
+        to_field_name='slug',
+        method='get_tags'
     )
     is_favorited = filters.BooleanFilter(method='get_favorite')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart'
     )
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
 
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = [
+            'tags', 'author', 'is_favorited', 'is_in_shopping_cart', 'search'
+        ]
+
+    # Фильтры по связанным таблицам строятся как полусоединения
+    # (id IN (подзапрос)): без JOIN рецепты не дублируются и DISTINCT
+    # не нужен.
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return queryset.filter(pk__in=RecipeTag.objects.filter(
+            tag__in=value
+        ).values('recipe'))
+
+    def get_search(self, queryset, name, value):
+        # Результаты упорядочены по релевантности, при равной — по дате.
+        return search_recipes(queryset, value)
 
     def get_favorite(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorited__user=self.request.user)
-        return queryset
+        return self.filter_by_user(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shopping_cart__user=self.request.user)
-        return queryset
+        return self.filter_by_user(queryset, ShoppingCart, value)
+
+    def filter_by_user(self, queryset, model, value):
+        if not value:
+            return queryset
+        if self.request.user.is_anonymous:
+            return queryset.none()
+        return queryset.filter(pk__in=model.objects.filter(
+            user=self.request.user
+        ).values('recipe'))
@@ -0,0 +1,163 @@
+import json
+import statistics
+import subprocess
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe
+
+User = get_user_model()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку, число запросов к БД и выделения памяти '
+        'для основных эндпоинтов API'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя (по умолчанию — с наибольшим числом '
+                 'подписок)'
+        )
+        parser.add_argument(
+            '--only', nargs='+',
+            help='Замерить только перечисленные эндпоинты'
+        )
+        parser.add_argument(
+            '--output', help='Файл для сохранения результатов в JSON'
+        )
+
+    def endpoints(self, user):
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        ingredient = Ingredient.objects.order_by('pk').first()
+        prefix = ingredient.name[:3] if ingredient else 'а'
+        endpoints = {
+            'recipes': ('/api/recipes/', False),
+            'recipes_auth': ('/api/recipes/?limit=24', True),
+            'recipes_tags': ('/api/recipes/?tags=breakfast&tags=lunch', True),
+            'recipes_cursor': ('/api/recipes/?pagination=cursor', True),
+            'recipes_favorited': ('/api/recipes/?is_favorited=1', True),
+            'subscriptions': (
+                '/api/users/subscriptions/?recipes_limit=3', True
+            ),
+            'download_shopping_cart': (
+                '/api/recipes/download_shopping_cart/', True
+            ),
+            'ingredients_search': (f'/api/ingredients/?name={prefix}', False),
+            'tags': ('/api/tags/', False),
+        }
+        if recipe is not None:
+            endpoints['recipe_detail'] = (f'/api/recipes/{recipe.pk}/', True)
+        return endpoints
+
+    def request(self, client, url, headers):
+        response = client.get(url, **headers)
+        if response.streaming:
+            size = sum(len(chunk) for chunk in response.streaming_content)
+        else:
+            size = len(response.content)
+        return response.status_code, size
+
+    def measure(self, client, url, headers, iterations, warmup):
+        for _ in range(warmup):
+            self.request(client, url, headers)
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            status, size = self.request(client, url, headers)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_query):
+            self.request(client, url, headers)
+        tracemalloc.start()
+        self.request(client, url, headers)
+        allocated, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {
+            'url': url,
+            'status': status,
+            'response_bytes': size,
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+            'queries': len(queries),
+            'peak_alloc_kib': round(peak / 1024, 1),
+        }
+
+    def handle(self, *args, **options):
+        users = User.objects.all()
+        if options['user']:
+            users = users.filter(pk=options['user'])
+        user = users.annotate(
+            follows=Count('follower')
+        ).order_by('-follows', 'pk').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей: сначала выполните seed_foodgram'
+            )
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client()
+        results = {}
+        for name, (url, auth) in self.endpoints(user).items():
+            if options['only'] and name not in options['only']:
+                continue
+            headers = (
+                {'HTTP_AUTHORIZATION': f'Token {token.key}'} if auth else {}
+            )
+            results[name] = self.measure(
+                client, url, headers, options['iterations'], options['warmup']
+            )
+            result = results[name]
+            self.stdout.write(
+                f'{name:24} {result["status"]} '
+                f'p50 {result["p50_ms"]:8.2f} мс  '
+                f'p95 {result["p95_ms"]:8.2f} мс  '
+                f'запросов {result["queries"]:3}  '
+                f'пик памяти {result["peak_alloc_kib"]:8.1f} КиБ'
+            )
+        report = {
+            'commit': current_commit(),
+            'database': connection.vendor,
+            'timestamp': timezone.now().isoformat(),
+            'user': user.pk,
+            'iterations': options['iterations'],
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Результаты сохранены в {options["output"]}'
+            ))
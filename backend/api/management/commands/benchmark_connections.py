@@ -0,0 +1,81 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, connections
+from django.test import Client
+
+from .benchmark_api import percentile
+
+# Режимы сравниваются на одном и том же процессе: меняются только
+# параметры соединения default.
+MODES = (
+    ('новое соединение', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+    ('постоянное', {'CONN_MAX_AGE': None, 'CONN_HEALTH_CHECKS': False}),
+)
+
+POOL_MODES = (
+    ('пул', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False}),
+    ('пул + проверка', {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True}),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает задержку запроса к API с новым соединением с БД '
+        'на каждый запрос, с постоянным соединением и с пулом '
+        '(ENGINE = foodgram.pool)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/api/recipes/?limit=1')
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+
+    def request(self, client, url):
+        # Тестовый Client не закрывает соединения по сигналам
+        # request_started и request_finished, как это делает сервер.
+        close_old_connections()
+        client.get(url)
+        close_old_connections()
+
+    def measure(self, url, iterations, warmup):
+        # Новый Client заново собирает middleware с текущими настройками.
+        client = Client()
+        for _ in range(warmup):
+            self.request(client, url)
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            self.request(client, url)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def handle(self, *args, **options):
+        engine = connection.settings_dict['ENGINE']
+        modes = POOL_MODES if engine == 'foodgram.pool' else MODES
+        self.stdout.write(
+            f'{engine}, {connection.settings_dict["HOST"] or "socket"}: '
+            f'GET {options["url"]}'
+        )
+        results = {}
+        for name, params in modes:
+            connection.close()
+            connection.settings_dict.update(params)
+            connections.databases[connection.alias].update(params)
+            timings = self.measure(
+                options['url'], options['iterations'], options['warmup']
+            )
+            results[name] = statistics.median(timings)
+            self.stdout.write(
+                f'{name:24} p50 {results[name]:8.2f} мс  '
+                f'p95 {percentile(timings, 0.95):8.2f} мс  '
+                f'среднее {statistics.mean(timings):8.2f} мс'
+            )
+        connection.close()
+        baseline = results[modes[0][0]]
+        for name, _ in modes[1:]:
+            self.stdout.write(
+                f'{name}: медиана меньше на '
+                f'{baseline - results[name]:.2f} мс, чем «{modes[0][0]}»'
+            )
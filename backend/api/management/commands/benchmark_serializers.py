@@ -0,0 +1,79 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from api.rows import RECIPE_LIST_FIELDS, RecipeRows
+from api.serializers import RecipeListSerializer
+from recipes.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает RecipeListSerializer и сериализацию из строк .values() '
+        'на одной странице рецептов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, default=100)
+        parser.add_argument('--iterations', type=int, default=30)
+
+    def handle(self, *args, **options):
+        user = User.objects.annotate(
+            follows=Count('follower')
+        ).order_by('-follows', 'pk').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей: сначала выполните seed_foodgram'
+            )
+        request = RequestFactory().get('/api/recipes/')
+        request.user = user
+        size = options['page_size']
+        renderer = JSONRenderer()
+
+        def serializer():
+            recipes = list(Recipe.objects.for_list(user)[:size])
+            return renderer.render(RecipeListSerializer(
+                recipes, many=True, context={'request': request}
+            ).data)
+
+        def rows():
+            recipes = list(Recipe.objects.with_user_flags(user).values(
+                *RECIPE_LIST_FIELDS
+            )[:size])
+            return renderer.render(RecipeRows(request).list(recipes))
+
+        if serializer() != rows():
+            raise CommandError('Ответы сериализаторов различаются')
+        results = {}
+        for name, build in (('serializer', serializer), ('rows', rows)):
+            queries = []
+
+            def count_query(execute, sql, params, many, context):
+                queries.append(sql)
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(count_query):
+                build()
+            timings = []
+            for _ in range(options['iterations']):
+                started = time.perf_counter()
+                build()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = statistics.median(timings)
+            self.stdout.write(
+                f'{name:12} p50 {results[name]:8.2f} мс  '
+                f'запросов {len(queries):3}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Ответы совпадают, ускорение в '
+            f'{results["serializer"] / results["rows"]:.1f} раза '
+            f'на странице из {size} рецептов'
+        ))
@@ -0,0 +1,124 @@
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from rest_framework.authtoken.models import Token
+
+from api.utils import SHOPPING_LIST_FORMATS
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem)
+
+User = get_user_model()
+
+INGREDIENTS_PER_RECIPE = 10
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет время до первого байта, полное время и пик памяти '
+        'при скачивании списка покупок для корзин разного размера. '
+        'Данные создаются во временной транзакции и откатываются'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows', type=int, nargs='+', default=[10, 1000, 50000],
+            help='Строк рецепт-ингредиент в корзине'
+        )
+        parser.add_argument(
+            '--format', nargs='+', dest='formats',
+            default=list(SHOPPING_LIST_FORMATS),
+            choices=list(SHOPPING_LIST_FORMATS)
+        )
+
+    def fill_cart(self, rows):
+        """Пользователь с корзиной из rows строк рецепт-ингредиент.
+
+        Все ингредиенты разные, поэтому в списке покупок тоже rows строк.
+        """
+        user = User.objects.create_user(
+            username='benchmark_shopping_list',
+            email='benchmark_shopping_list@foodgram.ru',
+            password='benchmark'
+        )
+        Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'benchmark ингредиент {number}',
+                measurement_unit='г'
+            )
+            for number in range(rows)
+        )
+        ingredients = list(Ingredient.objects.filter(
+            name__startswith='benchmark ингредиент '
+        ).values_list('pk', flat=True))
+        count = -(-rows // INGREDIENTS_PER_RECIPE)
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'benchmark рецепт {number}', text='benchmark',
+                author=user, cooking_time=1, image='recipes/images/x.png'
+            )
+            for number in range(count)
+        )
+        recipes = list(Recipe.objects.filter(
+            author=user
+        ).values_list('pk', flat=True))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipes[number // INGREDIENTS_PER_RECIPE],
+                ingredient_id=pk,
+                amount=1
+            )
+            for number, pk in enumerate(ingredients)
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=user, recipe_id=pk) for pk in recipes
+        )
+        # bulk_create не отправляет сигналы, которые ведут список покупок.
+        ShoppingListItem.objects.refresh([user.pk], ingredients)
+        return user
+
+    def measure(self, client, headers, file_format):
+        started = time.perf_counter()
+        tracemalloc.start()
+        response = client.get(
+            '/api/recipes/download_shopping_cart/',
+            {'format': file_format}, **headers
+        )
+        first_byte = None
+        size = 0
+        for chunk in response.streaming_content:
+            if first_byte is None:
+                first_byte = time.perf_counter()
+            size += len(chunk)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        finished = time.perf_counter()
+        return {
+            'status': response.status_code,
+            'ttfb_ms': ((first_byte or finished) - started) * 1000,
+            'total_ms': (finished - started) * 1000,
+            'response_kib': size / 1024,
+            'peak_alloc_kib': peak / 1024,
+        }
+
+    def handle(self, *args, **options):
+        client = Client()
+        for rows in options['rows']:
+            with transaction.atomic():
+                user = self.fill_cart(rows)
+                token = Token.objects.create(user=user)
+                headers = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+                for file_format in options['formats']:
+                    result = self.measure(client, headers, file_format)
+                    self.stdout.write(
+                        f'{rows:6} строк {file_format:4} '
+                        f'{result["status"]} '
+                        f'до первого байта {result["ttfb_ms"]:8.2f} мс  '
+                        f'всего {result["total_ms"]:8.2f} мс  '
+                        f'ответ {result["response_kib"]:8.1f} КиБ  '
+                        f'пик памяти {result["peak_alloc_kib"]:8.1f} КиБ'
+                    )
+                transaction.set_rollback(True)
@@ -0,0 +1,94 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from api.filters import FilterRecipe
+from recipes.models import Recipe, Tag
+
+User = get_user_model()
+
+# Строки плана, означающие полный просмотр таблицы.
+SEQUENTIAL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)(?!.*\bUSING\b)'),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Выводит планы запросов для фильтров ленты рецептов и завершается '
+        'с ошибкой, если какой-то из них просматривает таблицу целиком'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='id пользователя для фильтров избранного и списка покупок'
+        )
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Печатать планы всех запросов, а не только проблемных'
+        )
+
+    def hot_paths(self, user):
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        return {
+            'list': {},
+            'tags': {'tags': tags},
+            'author': {'author': str(user.pk)},
+            'is_favorited': {'is_favorited': '1'},
+            'is_in_shopping_cart': {'is_in_shopping_cart': '1'},
+            'tags+is_favorited': {'tags': tags, 'is_favorited': '1'},
+        }
+
+    def explain(self, queryset):
+        if connection.vendor != 'postgresql':
+            return queryset.explain()
+        with transaction.atomic():
+            # Без seq scan планировщик обязан найти индекс; если он всё же
+            # выбирает полный просмотр, подходящего индекса нет.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+
+    def handle(self, *args, **options):
+        pattern = SEQUENTIAL_SCAN.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(
+                f'СУБД {connection.vendor} не поддерживается'
+            )
+        users = User.objects.order_by('pk')
+        if options['user']:
+            users = users.filter(pk=options['user'])
+        user = users.first()
+        if user is None:
+            raise CommandError('Нет пользователей: заполните базу данных')
+        factory = RequestFactory()
+        failures = []
+        for name, params in self.hot_paths(user).items():
+            request = factory.get('/api/recipes/', params)
+            request.user = user
+            queryset = FilterRecipe(
+                request.GET,
+                queryset=Recipe.objects.for_list(user),
+                request=request
+            ).qs[:options['limit']]
+            plan = self.explain(queryset)
+            scans = sorted(set(pattern.findall(plan)))
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f'{name}: полный просмотр {", ".join(scans)}'
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: OK'))
+            if scans or options['verbose_plans']:
+                self.stdout.write(plan)
+        if failures:
+            raise CommandError(
+                f'Полный просмотр таблиц в фильтрах: {", ".join(failures)}'
+            )
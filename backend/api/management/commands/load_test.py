@@ -0,0 +1,197 @@
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import quote, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from .benchmark_api import current_commit, percentile
+
+DEFAULT_PATHS = (
+    '/api/tags/',
+    '/api/ingredients/?name=сол',
+    '/api/recipes/',
+)
+
+
+class Connection:
+    """Соединение HTTP/1.1 с keep-alive: после ответа без Content-Length
+    или с Connection: close сервер закрывает его, и оно открывается заново.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, path, headers):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+        lines = [f'GET {path} HTTP/1.1', f'Host: {self.host}', *headers]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        head = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin1')
+        status_line, *header_lines = head.split('\r\n')
+        fields = {}
+        for line in filter(None, header_lines):
+            name, _, value = line.partition(':')
+            fields[name.strip().lower()] = value.strip().lower()
+        if 'content-length' in fields:
+            await self.reader.readexactly(int(fields['content-length']))
+        elif fields.get('transfer-encoding') == 'chunked':
+            while True:
+                line = await self.reader.readline()
+                size = int(line.split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+        else:
+            await self.reader.read()
+            fields['connection'] = 'close'
+        if fields.get('connection') == 'close':
+            self.close()
+        return int(status_line.split()[1])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает запущенный сервер (gunicorn в режиме wsgi или asgi) '
+        'заданным числом одновременных соединений и замеряет пропускную '
+        'способность'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Адрес сервера, например '
+                                        'http://127.0.0.1:8000')
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[50, 200, 1000]
+        )
+        parser.add_argument('--duration', type=float, default=10)
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='Путь запроса; можно указать несколько раз'
+        )
+        parser.add_argument(
+            '--slow-clients', type=int, default=0,
+            help='Соединений, которые всё время замера медленно '
+                 'отправляют тело POST-запроса'
+        )
+        parser.add_argument('--token', help='Токен для заголовка '
+                                            'Authorization')
+        parser.add_argument(
+            '--output', help='Файл для сохранения результатов в JSON'
+        )
+
+    async def client(self, host, port, paths, headers, deadline, results):
+        connection = Connection(host, port)
+        index = 0
+        while time.monotonic() < deadline:
+            path = paths[index % len(paths)]
+            index += 1
+            started = time.perf_counter()
+            try:
+                status = await connection.request(path, headers)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                connection.close()
+                results['errors'] += 1
+                await asyncio.sleep(0.05)
+                continue
+            results['timings'].append(
+                (time.perf_counter() - started) * 1000
+            )
+            if status >= 400:
+                results['errors'] += 1
+        connection.close()
+
+    async def slow_client(self, host, port, deadline):
+        """Медленная загрузка: байт тела раз в полсекунды."""
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            return
+        writer.write((
+            f'POST /api/recipes/ HTTP/1.1\r\nHost: {host}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {10 ** 6}\r\n\r\n'
+        ).encode())
+        try:
+            while time.monotonic() < deadline:
+                writer.write(b' ')
+                await writer.drain()
+                await asyncio.sleep(0.5)
+        except OSError:
+            pass
+        writer.close()
+
+    async def run(self, host, port, concurrency, paths, headers, duration,
+                  slow_clients):
+        results = {'timings': [], 'errors': 0}
+        started = time.monotonic()
+        deadline = started + duration
+        await asyncio.gather(
+            *(
+                self.client(host, port, paths, headers, deadline, results)
+                for _ in range(concurrency)
+            ),
+            *(
+                self.slow_client(host, port, deadline)
+                for _ in range(slow_clients)
+            )
+        )
+        elapsed = time.monotonic() - started
+        timings = results['timings'] or [0]
+        return {
+            'concurrency': concurrency,
+            'slow_clients': slow_clients,
+            'requests': len(results['timings']),
+            'errors': results['errors'],
+            'rps': round(len(results['timings']) / elapsed, 1),
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+        }
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Ожидается адрес вида http://host:port')
+        paths = [
+            quote(path, safe='/?=&%')
+            for path in options['paths'] or DEFAULT_PATHS
+        ]
+        headers = []
+        if options['token']:
+            headers.append(f'Authorization: Token {options["token"]}')
+        results = []
+        for concurrency in options['concurrency']:
+            result = asyncio.run(self.run(
+                url.hostname, url.port or 80, concurrency, paths, headers,
+                options['duration'], options['slow_clients']
+            ))
+            results.append(result)
+            self.stdout.write(
+                f'{concurrency:5} соединений  '
+                f'{result["rps"]:8.1f} запр/с  '
+                f'p50 {result["p50_ms"]:8.2f} мс  '
+                f'p95 {result["p95_ms"]:8.2f} мс  '
+                f'ошибок {result["errors"]}'
+            )
+        if options['output']:
+            report = {
+                'commit': current_commit(),
+                'url': options['url'],
+                'paths': paths,
+                'duration': options['duration'],
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Результаты сохранены в {options["output"]}'
+            ))
@@ -1,5 +1,105 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination, _positive_int)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from recipes.models import FeedItem
+
+
+def recipes_limit(request):
+    """Параметр recipes_limit; неверное значение не учитывается,
+    как limit у пагинаторов.
+    """
+    try:
+        return _positive_int(
+            request.query_params['recipes_limit'], strict=True
+        )
+    except (KeyError, ValueError):
+        return None
 
 
 class PaginationWithLimit(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset-пагинация ленты рецептов без OFFSET и COUNT(*)."""
+
+    ordering = ('-pub_date', '-id')
+    page_size_query_param = 'limit'
+
+
+class FeedPagination(BasePagination):
+    """Keyset-пагинация ленты подписок по позиции (pub_date, id).
+
+    Курсор хранит позицию последнего рецепта страницы, поэтому каждая
+    страница читает не больше limit + 1 строк ленты.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_feed(self, request):
+        """Возвращает идентификаторы рецептов страницы ленты."""
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        positions = FeedItem.objects.page(
+            request.user, page_size + 1, self.decode_cursor(request)
+        )
+        self.page = positions[:page_size]
+        self.has_next = len(positions) > page_size
+        return [pk for _, pk in self.page]
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            pub_date, pk = urlsafe_b64decode(
+                encoded.encode('ascii')
+            ).decode('ascii').split('|')
+            position = (parse_datetime(pub_date), int(pk))
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if position[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        pub_date, pk = position
+        encoded = urlsafe_b64encode(
+            f'{pub_date.isoformat()}|{pk}'.encode('ascii')
+        ).decode('ascii')
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, encoded
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1])
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
@@ -0,0 +1,170 @@
+"""Быстрая сериализация списков только для чтения.
+
+Ответы собираются из строк .values() по заранее составленным планам
+полей, без создания экземпляров моделей. Результат совпадает с выводом
+RecipeListSerializer, RecipeMiniSerializer и SubscribeListSerializer.
+"""
+from operator import itemgetter
+
+from django.contrib.auth import get_user_model
+from django.db.models import BooleanField, Exists, F, OuterRef, Value
+
+from recipes.models import Recipe, RecipeIngredient, Tag
+from users.models import Follow
+from .fields import ImageVariantsField
+
+User = get_user_model()
+
+image_storage = Recipe._meta.get_field('image').storage
+
+
+class RowPlan:
+    """Порядок ключей ответа и способ получить каждое значение из строки.
+
+    Поле задаётся именем столбца или парой (ключ, функция от строки).
+    """
+
+    def __init__(self, *fields):
+        self.fields = tuple(
+            (field, itemgetter(field)) if isinstance(field, str) else field
+            for field in fields
+        )
+
+    def __call__(self, row):
+        return {key: get(row) for key, get in self.fields}
+
+
+TAG_PLAN = RowPlan('id', 'name', 'color', 'slug')
+
+INGREDIENT_PLAN = RowPlan(
+    ('id', itemgetter('ingredient_id')),
+    ('name', itemgetter('ingredient__name')),
+    ('measurement_unit', itemgetter('ingredient__measurement_unit')),
+    'amount'
+)
+
+AUTHOR_PLAN = RowPlan(
+    'id', 'username', 'first_name', 'last_name', 'email', 'is_subscribed'
+)
+
+SUBSCRIPTION_FIELDS = (
+    'id', 'email', 'username', 'first_name', 'last_name', 'recipes_count'
+)
+
+RECIPE_LIST_FIELDS = (
+    'id', 'pub_date', 'author_id', 'is_favorited', 'is_in_shopping_cart',
+    'name', 'image', 'image_hash', 'text', 'cooking_time'
+)
+
+RECIPE_MINI_FIELDS = (
+    'id', 'pub_date', 'author_id', 'name', 'image', 'image_hash',
+    'cooking_time'
+)
+
+
+class RecipeRows:
+    """Сериализация строк рецептов для одного запроса.
+
+    Ссылки на изображения строятся так же, как в ImageField и
+    ImageVariantsField: относительно адреса запроса.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.user = request.user
+        self.variants = ImageVariantsField()
+        self.variants._context = {'request': request}
+        self.mini_plan = RowPlan(
+            'id',
+            'name',
+            ('image', self.image),
+            ('image_variants', self.image_variants),
+            'cooking_time'
+        )
+
+    def image(self, row):
+        if not row['image']:
+            return None
+        url = image_storage.url(row['image'])
+        return self.request.build_absolute_uri(url)
+
+    def image_variants(self, row):
+        return self.variants.to_representation(row['image_hash'])
+
+    def authors(self, ids):
+        if self.user.is_anonymous:
+            is_subscribed = Value(False, output_field=BooleanField())
+        else:
+            is_subscribed = Exists(Follow.objects.filter(
+                user=self.user, author=OuterRef('pk')
+            ))
+        return {
+            row['id']: AUTHOR_PLAN(row)
+            for row in User.objects.filter(pk__in=ids).annotate(
+                is_subscribed=is_subscribed
+            ).values(
+                'id', 'username', 'first_name', 'last_name', 'email',
+                'is_subscribed'
+            )
+        }
+
+    def list(self, rows):
+        """Повторяет RecipeListSerializer(many=True) для строк
+        Recipe.objects.with_user_flags(user).values(*RECIPE_LIST_FIELDS).
+        """
+        ids = [row['id'] for row in rows]
+        tags = {recipe_id: [] for recipe_id in ids}
+        for row in Tag.objects.filter(recipes__in=ids).values(
+            'id', 'name', 'color', 'slug', recipe_id=F('recipes')
+        ):
+            tags[row['recipe_id']].append(TAG_PLAN(row))
+        ingredients = {recipe_id: [] for recipe_id in ids}
+        for row in RecipeIngredient.objects.filter(recipe__in=ids).values(
+            'recipe_id', 'ingredient_id', 'ingredient__name',
+            'ingredient__measurement_unit', 'amount'
+        ):
+            ingredients[row['recipe_id']].append(INGREDIENT_PLAN(row))
+        authors = self.authors({row['author_id'] for row in rows})
+        return [
+            {
+                'id': row['id'],
+                'tags': tags[row['id']],
+                'author': authors[row['author_id']],
+                'ingredients': ingredients[row['id']],
+                'is_favorited': row['is_favorited'],
+                'is_in_shopping_cart': row['is_in_shopping_cart'],
+                'name': row['name'],
+                'image': self.image(row),
+                'image_variants': self.image_variants(row),
+                'text': row['text'],
+                'cooking_time': row['cooking_time'],
+            }
+            for row in rows
+        ]
+
+    def mini(self, rows):
+        """Повторяет RecipeMiniSerializer(many=True)."""
+        return [self.mini_plan(row) for row in rows]
+
+    def subscriptions(self, rows, recipes):
+        """Повторяет SubscribeListSerializer(many=True) для строк
+        авторов с полями SUBSCRIPTION_FIELDS и queryset их рецептов.
+        """
+        by_author = {row['id']: [] for row in rows}
+        for recipe in recipes.filter(author__in=by_author).values(
+            *RECIPE_MINI_FIELDS
+        ):
+            by_author[recipe['author_id']].append(self.mini_plan(recipe))
+        return [
+            {
+                'id': row['id'],
+                'email': row['email'],
+                'username': row['username'],
+                'first_name': row['first_name'],
+                'last_name': row['last_name'],
+                'is_subscribed': True,
+                'recipes': by_author[row['id']],
+                'recipes_count': row['recipes_count'],
+            }
+            for row in rows
+        ]
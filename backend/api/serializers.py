@@ -1,12 +1,16 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            RecipeTag, ShoppingCart, Tag)
+                            RecipeTag, ShoppingCart, ShoppingListItem, Tag)
+from recipes.search import update_search_index
 from users.models import Follow
-from .fields import Base64ImageField
+from .fields import Base64ImageField, ImageVariantsField
+from .paginators import recipes_limit
 
 User = get_user_model()
 
@@ -27,6 +31,8 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = None
         request = self.context.get("request")
         if request and hasattr(request, "user"):
@@ -90,6 +96,7 @@ class RecipeListSerializer(serializers.ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
@@ -102,11 +109,14 @@ class RecipeListSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
             'cooking_time'
         )
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
@@ -115,6 +125,8 @@ class RecipeListSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request.user.is_anonymous:
             return False
@@ -125,6 +137,8 @@ class RecipeListSerializer(serializers.ModelSerializer):
 
 class RecipeMiniSerializer(serializers.ModelSerializer):
 
+    image_variants = ImageVariantsField()
+
     class Meta:
 
         model = Recipe
@@ -132,6 +146,7 @@ class RecipeMiniSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
 
@@ -168,20 +183,22 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('author',)
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
         self.add_ingredients_tags(recipe, ingredients, tags)
+        update_search_index([recipe.pk])
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        RecipeTag.objects.filter(recipe=instance).delete()
-        RecipeIngredient.objects.filter(recipe=instance).delete()
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         super().update(instance, validated_data)
-        self.add_ingredients_tags(instance, ingredients, tags)
+        self.update_tags(instance, tags)
+        self.update_ingredients(instance, ingredients)
         return instance
 
     def add_ingredients_tags(self, recipe, ingredients, tags):
@@ -204,6 +221,66 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
             )
         RecipeTag.objects.bulk_create(tags_to_db)
 
+    def update_tags(self, recipe, tags):
+        current = set(
+            RecipeTag.objects.filter(
+                recipe=recipe
+            ).values_list('tag_id', flat=True)
+        )
+        submitted = {tag.id for tag in tags}
+        if current - submitted:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=current - submitted
+            ).delete()
+        RecipeTag.objects.bulk_create([
+            RecipeTag(recipe=recipe, tag_id=tag_id)
+            for tag_id in submitted - current
+        ])
+
+    def update_ingredients(self, recipe, ingredients):
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient
+            in RecipeIngredient.objects.filter(recipe=recipe)
+        }
+        submitted = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = current.keys() - submitted.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed = []
+        for ingredient_id, amount in submitted.items():
+            recipe_ingredient = current.get(ingredient_id)
+            if recipe_ingredient and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        added = submitted.keys() - current.keys()
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=submitted[ingredient_id]
+            )
+            for ingredient_id in added
+        ])
+        # Массовые операции не отправляют сигналы: списки покупок
+        # пересчитываются здесь, только по затронутым ингредиентам.
+        affected = removed | added | {
+            recipe_ingredient.ingredient_id for recipe_ingredient in changed
+        }
+        if affected:
+            ShoppingListItem.objects.refresh(
+                ShoppingCart.objects.filter(recipe=recipe).values('user'),
+                affected
+            )
+            update_search_index([recipe.pk])
+
     def validate_ingredients(self, value):
         ingredients_list = []
         for ingredient in value:
@@ -213,6 +290,19 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
                     'Попытка добавления повторяющегося ингредиента'
                 )
             ingredients_list.append(ingredient_id)
+        existing = set(
+            Ingredient.objects.filter(
+                id__in=ingredients_list
+            ).values_list('id', flat=True)
+        )
+        missing = [
+            ingredient_id for ingredient_id in ingredients_list
+            if ingredient_id not in existing
+        ]
+        if missing:
+            raise serializers.ValidationError(
+                f'Несуществующие ингредиенты: {missing}'
+            )
         return value
 
     def to_representation(self, recipe):
@@ -223,7 +313,7 @@ class SubscribeListSerializer(serializers.ModelSerializer):
 
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField()
 
     class Meta:
 
@@ -240,6 +330,8 @@ class SubscribeListSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context['request']
         return Follow.objects.filter(user=request.user, author=obj).exists()
 
@@ -247,16 +339,16 @@ class SubscribeListSerializer(serializers.ModelSerializer):
         request = self.context['request']
         if request.user.is_anonymous:
             return False
-        recipes = Recipe.objects.filter(author=obj)
-        limit = request.query_params.get('recipes_limit')
-        if limit:
-            recipes = recipes[:int(limit)]
-        return RecipeListSerializer(
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes = Recipe.objects.filter(author=obj)
+            limit = recipes_limit(request)
+            if limit:
+                recipes = recipes[:limit]
+        return RecipeMiniSerializer(
             recipes, many=True, context=self.context).data
 
-    def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
-
 
 class SubscribeCreateDestroySerializer(serializers.ModelSerializer):
 
@@ -323,3 +415,26 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
                 instance.recipe,
                 context=self.context
             ).data
+
+
+class BulkToggleSerializer(serializers.Serializer):
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_TOGGLE_LIMIT
+    )
+
+
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+    amount = serializers.ReadOnlyField(source='total_amount')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
@@ -0,0 +1,151 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipes.images import image_processed
+from recipes.signals import bulk_loaded
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from users.models import Follow
+from .authentication import CachedTokenAuthentication
+from .caching import (bump_recipes_version, bump_user_state,
+                      ingredient_catalog, tag_catalog)
+from .cookable import cookable_index
+
+User = get_user_model()
+
+for model, catalog in ((Tag, tag_catalog), (Ingredient, ingredient_catalog)):
+    post_save.connect(
+        catalog.invalidate,
+        sender=model,
+        dispatch_uid=f'{catalog.name}_catalog_save'
+    )
+    post_delete.connect(
+        catalog.invalidate,
+        sender=model,
+        dispatch_uid=f'{catalog.name}_catalog_delete'
+    )
+    bulk_loaded.connect(
+        catalog.invalidate,
+        sender=model,
+        dispatch_uid=f'{catalog.name}_catalog_bulk_loaded'
+    )
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    # Выход через djoser (token/logout) удаляет токен.
+    CachedTokenAuthentication.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    # Смена пароля, деактивация и любое другое изменение пользователя.
+    for key in Token.objects.filter(
+        user=instance
+    ).values_list('key', flat=True):
+        CachedTokenAuthentication.invalidate(key)
+
+
+# Поля пользователя, которые входят в ответ рецепта как данные автора.
+AUTHOR_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+@receiver(pre_save, sender=User)
+def check_author_fields(sender, instance, update_fields, **kwargs):
+    # Вход (last_login), активация и смена пароля рецептов не меняют.
+    instance._author_changed = False
+    if instance._state.adding or (
+        update_fields is not None
+        and not set(update_fields) & set(AUTHOR_FIELDS)
+    ):
+        return
+    saved = User.objects.filter(pk=instance.pk).values_list(
+        *AUTHOR_FIELDS
+    ).first()
+    instance._author_changed = saved != tuple(
+        getattr(instance, name) for name in AUTHOR_FIELDS
+    )
+
+
+@receiver(post_save, sender=User)
+def touch_author_recipes(sender, instance, created, **kwargs):
+    if created or not getattr(instance, '_author_changed', False):
+        return
+    Recipe.objects.filter(author=instance).update(updated_at=timezone.now())
+    transaction.on_commit(bump_recipes_version)
+
+
+def bump_owner_state(sender, instance, **kwargs):
+    # Как и версия рецептов, меняется после фиксации транзакции.
+    transaction.on_commit(lambda: bump_user_state(instance.user_id))
+
+
+for model in (Favorite, ShoppingCart, Follow):
+    post_save.connect(
+        bump_owner_state,
+        sender=model,
+        dispatch_uid=f'{model.__name__.lower()}_user_state_save'
+    )
+    post_delete.connect(
+        bump_owner_state,
+        sender=model,
+        dispatch_uid=f'{model.__name__.lower()}_user_state_delete'
+    )
+
+
+def invalidate_cookable_index(sender, **kwargs):
+    # Сериализатор пишет ингредиенты массово уже после сохранения рецепта:
+    # версия меняется, когда транзакция с ними зафиксирована.
+    transaction.on_commit(cookable_index.invalidate)
+
+
+for model in (Recipe, RecipeIngredient):
+    post_save.connect(
+        invalidate_cookable_index,
+        sender=model,
+        dispatch_uid=f'{model.__name__.lower()}_cookable_save'
+    )
+    post_delete.connect(
+        invalidate_cookable_index,
+        sender=model,
+        dispatch_uid=f'{model.__name__.lower()}_cookable_delete'
+    )
+    bulk_loaded.connect(
+        invalidate_cookable_index,
+        sender=model,
+        dispatch_uid=f'{model.__name__.lower()}_cookable_bulk_loaded'
+    )
+
+
+def invalidate_recipes(sender, **kwargs):
+    # Версия меняется после фиксации транзакции: иначе ответ, собранный
+    # по старым данным, получил бы ETag новой версии.
+    transaction.on_commit(bump_recipes_version)
+
+
+image_processed.connect(
+    invalidate_recipes, dispatch_uid='recipe_image_processed'
+)
+
+for model in (Recipe, RecipeIngredient, RecipeTag):
+    bulk_loaded.connect(
+        invalidate_recipes,
+        sender=model,
+        dispatch_uid=f'{model.__name__.lower()}_recipes_bulk_loaded'
+    )
+
+for model in (Recipe, RecipeIngredient, RecipeTag):
+    post_save.connect(
+        invalidate_recipes,
+        sender=model,
+        dispatch_uid=f'{model.__name__.lower()}_recipes_save'
+    )
+    post_delete.connect(
+        invalidate_recipes,
+        sender=model,
+        dispatch_uid=f'{model.__name__.lower()}_recipes_delete'
+    )
@@ -0,0 +1,932 @@
+import base64
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db.models import Sum
+from django.db.utils import ConnectionDoesNotExist
+from django.test import SimpleTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from foodgram.routers import ReplicaRouter
+from recipes.models import (Favorite, FeedItem, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingListItem,
+                            StaleRecommendation, Tag)
+from users.models import Follow
+from .authentication import CachedTokenAuthentication
+from .caching import recipes_version
+from .cookable import cookable_index
+from .fields import Base64ImageField
+from .views import RecipeViewSet
+
+User = get_user_model()
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pw'
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@foodgram.ru',
+                password='pw'
+            )
+            for i in range(3)
+        ]
+        tags = [
+            Tag.objects.create(name=slug, color=f'#00000{i}', slug=slug)
+            for i, slug in enumerate(('breakfast', 'lunch'))
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(5)
+        ]
+        for i in range(30):
+            recipe = Recipe.objects.create(
+                name=f'рецепт {i}', text='текст', cooking_time=10,
+                author=authors[i % len(authors)],
+                image='recipes/images/recipe.png', image_hash='hash'
+            )
+            recipe.tags.set(tags[:i % 2 + 1])
+            for ingredient in ingredients[:3]:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=i + 1
+                )
+            if i % 3 == 0:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=authors[0])
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        CachedTokenAuthentication._local.clear()
+
+    def assert_list_queries(self, number, limit):
+        with self.assertNumQueries(number):
+            response = self.client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return response
+
+    def test_anonymous(self):
+        for limit in (6, 24):
+            with self.subTest(limit=limit):
+                self.assert_list_queries(5, limit)
+
+    def test_authenticated(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        # Токен проверяется по БД один раз, дальше читается из кеша.
+        self.client.get('/api/users/me/')
+        for limit in (6, 24):
+            with self.subTest(limit=limit):
+                results = self.assert_list_queries(5, limit).data['results']
+                self.assertTrue(any(
+                    recipe['is_favorited'] for recipe in results
+                ))
+                self.assertTrue(any(
+                    recipe['is_in_shopping_cart'] for recipe in results
+                ))
+                self.assertTrue(any(
+                    recipe['author']['is_subscribed'] for recipe in results
+                ))
+
+
+class SubscriptionsRecipesLimitTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pw'
+        )
+        author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pw'
+        )
+        for i in range(3):
+            Recipe.objects.create(
+                name=f'рецепт {i}', text='текст', cooking_time=10,
+                author=author, image='recipes/images/recipe.png',
+                image_hash='hash'
+            )
+        Follow.objects.create(user=cls.user, author=author)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_invalid_limit_is_ignored(self):
+        for limit in ('abc', '-1', '0'):
+            with self.subTest(recipes_limit=limit):
+                response = self.client.get(
+                    '/api/users/subscriptions/', {'recipes_limit': limit}
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    len(response.data['results'][0]['recipes']), 3
+                )
+
+    def test_limit(self):
+        response = self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 2}
+        )
+        self.assertEqual(len(response.data['results'][0]['recipes']), 2)
+
+
+class FilterPlanTest(APITestCase):
+    """Фильтры ленты рецептов не просматривают таблицы целиком."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pw'
+        )
+        tags = [
+            Tag.objects.create(name=slug, color=f'#00000{i}', slug=slug)
+            for i, slug in enumerate(('breakfast', 'lunch', 'dinner'))
+        ]
+        for i in range(20):
+            recipe = Recipe.objects.create(
+                name=f'рецепт {i}', text='текст', cooking_time=10,
+                author=cls.user, image='recipes/images/recipe.png',
+                image_hash='hash'
+            )
+            recipe.tags.set(tags[i % 3:])
+            if i % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def test_hot_filters_use_indexes(self):
+        output = StringIO()
+        try:
+            call_command(
+                'explain_filters', user=self.user.pk, stdout=output
+            )
+        except CommandError as error:
+            self.fail(f'{error}\n{output.getvalue()}')
+
+
+class CachedUserCountersTest(APITestCase):
+    """Пользователь из кеша токенов не перезаписывает счётчики."""
+
+    password = 'Zx9-counters-password'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru',
+            password=cls.password
+        )
+        cls.follower = User.objects.create_user(
+            username='follower', email='follower@foodgram.ru',
+            password='pw'
+        )
+        cls.token = Token.objects.create(user=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        CachedTokenAuthentication._local.clear()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        # Пользователь попадает в кеш до того, как у него появится
+        # подписчик.
+        self.client.get('/api/users/me/')
+        Follow.objects.create(user=self.follower, author=self.author)
+
+    def assert_followers_kept(self):
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+
+    def test_set_password(self):
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': self.password,
+            'new_password': 'Zx9-another-password',
+        })
+        self.assertEqual(response.status_code, 204)
+        self.assert_followers_kept()
+
+    def test_update_me(self):
+        response = self.client.patch(
+            '/api/users/me/', {'first_name': 'Автор'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_followers_kept()
+        self.assertEqual(self.author.first_name, 'Автор')
+
+    def test_stale_recipe(self):
+        recipe = Recipe.objects.create(
+            name='рецепт', text='текст', cooking_time=10,
+            author=self.author, image='recipes/images/recipe.png',
+            image_hash='hash'
+        )
+        Favorite.objects.create(user=self.follower, recipe=recipe)
+        recipe.name = 'новое название'
+        recipe.save()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.name, 'новое название')
+
+
+class RecipeDetailTest(APITestCase):
+
+    def test_invalid_pk(self):
+        for pk in ('abc', '999'):
+            with self.subTest(pk=pk):
+                response = self.client.get(f'/api/recipes/{pk}/')
+                self.assertEqual(response.status_code, 404)
+
+
+class RecipeListETagTest(APITransactionTestCase):
+    """ETag списка меняется после фиксации любой правки рецептов."""
+
+    def setUp(self):
+        cache.clear()
+        self.author = author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pw'
+        )
+        self.recipe = Recipe.objects.create(
+            name='рецепт', text='текст', cooking_time=10, author=author,
+            image='recipes/images/recipe.png', image_hash='hash'
+        )
+
+    def get(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get('/api/recipes/', **headers)
+
+    def test_not_modified(self):
+        etag = self.get()['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get(etag).status_code, 304)
+
+    def test_changed(self):
+        etag = self.get()['ETag']
+        self.recipe.name = 'новое название'
+        self.recipe.save()
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['name'], 'новое название')
+
+    def test_user_state_changed(self):
+        self.client.force_authenticate(self.author)
+        etag = self.get()['ETag']
+        self.client.post(f'/api/recipes/{self.recipe.pk}/favorite/')
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+
+    def test_users_do_not_share_etag(self):
+        reader = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pw'
+        )
+        with mock.patch('api.caching.user_state_version', return_value=1):
+            self.client.force_authenticate(self.author)
+            etag = self.get()['ETag']
+            self.client.force_authenticate(reader)
+            self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_bulk_user_state_changed(self):
+        self.client.force_authenticate(self.author)
+        etag = self.get()['ETag']
+        self.client.post(
+            '/api/recipes/favorite/bulk/', {'ids': [self.recipe.pk]},
+            format='json'
+        )
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+
+    def test_author_saves(self):
+        version = recipes_version()
+        User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pw'
+        )
+        self.author.is_active = False
+        self.author.save()
+        self.author.set_password('another')
+        self.author.save(update_fields=['password'])
+        self.assertEqual(recipes_version(), version)
+        self.author.first_name = 'Автор'
+        self.author.save()
+        self.assertNotEqual(recipes_version(), version)
+
+
+class CookableStaleIndexTest(APITestCase):
+    """Оценки рецептов не сдвигаются, если индекс ещё помнит удалённый."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pw'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(4)
+        ]
+        cls.recipes = []
+        for size in (2, 3, 4):
+            recipe = Recipe.objects.create(
+                name=f'рецепт {size}', text='текст', cooking_time=10,
+                author=author, image='recipes/images/recipe.png',
+                image_hash='hash'
+            )
+            for ingredient in cls.ingredients[:size]:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        cache.clear()
+        cookable_index.__init__()
+
+    def get_scores(self):
+        response = self.client.get('/api/recipes/cookable/', {
+            'ingredients': [
+                ingredient.pk for ingredient in self.ingredients[:2]
+            ]
+        })
+        self.assertEqual(response.status_code, 200)
+        return {
+            recipe['id']: (recipe['coverage'], recipe['missing'])
+            for recipe in response.data['results']
+        }
+
+    def test_deleted_recipe(self):
+        scores = self.get_scores()
+        self.assertEqual(len(scores), 3)
+        # Версия индекса меняется только после фиксации транзакции, и в
+        # тесте индекс остаётся устаревшим.
+        del scores[self.recipes[0].pk]
+        self.recipes[0].delete()
+        self.assertEqual(self.get_scores(), scores)
+
+
+class LoadIngredientsCatalogTest(APITestCase):
+    """Загрузка ингредиентов командой меняет версию справочника."""
+
+    def test_catalog_invalidated(self):
+        etag = self.client.get('/api/ingredients/')['ETag']
+        with tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', encoding='utf-8'
+        ) as file:
+            file.write('соль,г\n')
+            file.flush()
+            call_command(
+                'load_ingredients', file.name, no_copy=True,
+                stdout=StringIO(), stderr=StringIO()
+            )
+        response = self.client.get(
+            '/api/ingredients/', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['name'], 'соль')
+
+
+class Base64ImageFieldTest(SimpleTestCase):
+
+    content = bytes(range(256)) * 1000
+    header = 'data:image/png;base64,'
+
+    def decode(self, data):
+        return Base64ImageField().decode(
+            data, len(self.header), 'temp.png'
+        ).read()
+
+    def test_in_memory(self):
+        data = self.header + base64.b64encode(self.content).decode()
+        self.assertEqual(self.decode(data), self.content)
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=1000)
+    def test_chunked(self):
+        data = self.header + base64.b64encode(self.content).decode()
+        self.assertEqual(self.decode(data), self.content)
+
+    def test_invalid(self):
+        for payload in ('abc', 'абвг'):
+            with self.subTest(payload=payload):
+                with self.assertRaises(ValidationError):
+                    self.decode(self.header + payload)
+
+
+class CountersTestCase(APITestCase):
+    """Автор с двумя рецептами, два читателя и сверка с recount."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pw'
+        )
+        cls.readers = [
+            User.objects.create_user(
+                username=f'reader{i}', email=f'reader{i}@foodgram.ru',
+                password='pw'
+            )
+            for i in range(2)
+        ]
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.recipes = []
+        for i in range(2):
+            recipe = Recipe.objects.create(
+                name=f'рецепт {i}', text='текст', cooking_time=10,
+                author=cls.author, image='recipes/images/recipe.png',
+                image_hash='hash'
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=i + 1
+            )
+            cls.recipes.append(recipe)
+
+    def state(self):
+        return (
+            list(User.objects.order_by('pk').values_list(
+                'pk', 'recipes_count', 'followers_count'
+            )),
+            list(Recipe.objects.order_by('pk').values_list(
+                'pk', 'favorites_count'
+            )),
+            list(ShoppingListItem.objects.order_by(
+                'user', 'ingredient'
+            ).values_list('user', 'ingredient', 'total_amount')),
+            list(FeedItem.objects.order_by('user', 'recipe').values_list(
+                'user', 'recipe', 'pub_date'
+            )),
+        )
+
+    def assert_recount_noop(self):
+        state = self.state()
+        call_command('recount', stdout=StringIO())
+        self.assertEqual(self.state(), state)
+
+    def as_user(self, user):
+        self.client.force_authenticate(user)
+        return self.client
+
+
+class CountersTest(CountersTestCase):
+    """Счётчики подписчиков, рецептов и избранного совпадают с данными."""
+
+    def test_follow_unfollow(self):
+        url = f'/api/users/{self.author.pk}/subscribe/'
+        for reader in self.readers:
+            self.assertEqual(self.as_user(reader).post(url).status_code, 201)
+        self.assertEqual(self.as_user(reader).post(url).status_code, 400)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 2)
+        self.assert_recount_noop()
+        self.assertEqual(self.as_user(reader).delete(url).status_code, 204)
+        self.assertEqual(self.as_user(reader).delete(url).status_code, 404)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assert_recount_noop()
+
+    def test_favorite_add_remove(self):
+        recipe = self.recipes[0]
+        url = f'/api/recipes/{recipe.pk}/favorite/'
+        for reader in self.readers:
+            self.assertEqual(self.as_user(reader).post(url).status_code, 201)
+        self.assertEqual(self.as_user(reader).post(url).status_code, 400)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 2)
+        self.assert_recount_noop()
+        self.assertEqual(self.as_user(reader).delete(url).status_code, 204)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assert_recount_noop()
+
+    def test_recipe_delete(self):
+        recipe = self.recipes[0]
+        for reader in self.readers:
+            self.as_user(reader).post(f'/api/recipes/{recipe.pk}/favorite/')
+            self.as_user(reader).post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/'
+            )
+            self.as_user(reader).post(
+                f'/api/users/{self.author.pk}/subscribe/'
+            )
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 2)
+        self.assert_recount_noop()
+        response = self.as_user(self.author).delete(
+            f'/api/recipes/{recipe.pk}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertFalse(ShoppingListItem.objects.exists())
+        self.assert_recount_noop()
+
+
+class BulkToggleTest(CountersTestCase):
+    """Массовое добавление и удаление связей делает то же, что одиночное."""
+
+    def bulk(self, user, url, ids, method='post'):
+        return getattr(self.as_user(user), method)(
+            f'/api/{url}/bulk/', {'ids': ids}, format='json'
+        )
+
+    def test_favorite(self):
+        ids = [recipe.pk for recipe in self.recipes]
+        reader = self.readers[0]
+        self.as_user(reader).post(f'/api/recipes/{ids[0]}/favorite/')
+        StaleRecommendation.objects.all().delete()
+        response = self.bulk(reader, 'recipes/favorite', ids + ids + [999])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'added': ids[1:]})
+        self.assertEqual(
+            list(Recipe.objects.order_by('pk').values_list(
+                'favorites_count', flat=True
+            )),
+            [1, 1]
+        )
+        self.assertEqual(
+            set(StaleRecommendation.objects.values_list('pk', flat=True)),
+            set(ids[1:])
+        )
+        self.assert_recount_noop()
+        response = self.bulk(reader, 'recipes/favorite', ids, 'delete')
+        self.assertEqual(response.data, {'removed': ids})
+        self.assertFalse(
+            Recipe.objects.filter(favorites_count__gt=0).exists()
+        )
+        self.assertEqual(StaleRecommendation.objects.count(), 2)
+        self.assert_recount_noop()
+
+    def test_shopping_cart(self):
+        ids = [recipe.pk for recipe in self.recipes]
+        reader = self.readers[0]
+        response = self.bulk(reader, 'recipes/shopping_cart', ids)
+        self.assertEqual(response.data, {'added': ids})
+        self.assertEqual(
+            list(ShoppingListItem.objects.values_list(
+                'user', 'total_amount'
+            )),
+            [(reader.pk, 3)]
+        )
+        self.assert_recount_noop()
+        response = self.bulk(
+            reader, 'recipes/shopping_cart', ids[:1], 'delete'
+        )
+        self.assertEqual(response.data, {'removed': ids[:1]})
+        self.assertEqual(
+            ShoppingListItem.objects.get(user=reader).total_amount, 2
+        )
+        self.assert_recount_noop()
+
+    def test_subscribe(self):
+        reader = self.readers[0]
+        response = self.bulk(
+            reader, 'users/subscribe', [self.author.pk, reader.pk]
+        )
+        self.assertEqual(response.data, {'added': [self.author.pk]})
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(
+            set(FeedItem.objects.filter(user=reader).values_list(
+                'recipe', flat=True
+            )),
+            {recipe.pk for recipe in self.recipes}
+        )
+        self.assert_recount_noop()
+        response = self.bulk(
+            reader, 'users/subscribe', [self.author.pk], 'delete'
+        )
+        self.assertEqual(response.data, {'removed': [self.author.pk]})
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+        self.assertFalse(FeedItem.objects.exists())
+        self.assert_recount_noop()
+
+    def test_invalid_ids(self):
+        reader = self.readers[0]
+        limit = settings.BULK_TOGGLE_LIMIT
+        for ids in ([], [0], 'abc', list(range(1, limit + 2))):
+            with self.subTest(ids=ids):
+                response = self.bulk(reader, 'recipes/favorite', ids)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            self.bulk(
+                reader, 'recipes/favorite', list(range(1, limit + 1))
+            ).status_code,
+            200
+        )
+
+    def test_duplicate_single_add(self):
+        url = f'/api/recipes/{self.recipes[0].pk}/favorite/'
+        self.bulk(self.readers[0], 'recipes/favorite', [self.recipes[0].pk])
+        self.assertEqual(self.as_user(self.readers[0]).post(url).status_code,
+                         400)
+        self.assertEqual(
+            Favorite.objects.filter(user=self.readers[0]).count(), 1
+        )
+
+
+class ShoppingListMaintenanceTest(APITestCase):
+    """Список покупок совпадает с суммой ингредиентов рецептов в корзине."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pw'
+        )
+        cls.readers = [
+            User.objects.create_user(
+                username=f'reader{i}', email=f'reader{i}@foodgram.ru',
+                password='pw'
+            )
+            for i in range(2)
+        ]
+        cls.tag = Tag.objects.create(
+            name='breakfast', color='#000000', slug='breakfast'
+        )
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(4)
+        ]
+        cls.recipes = []
+        for amounts in ({0: 1, 1: 2}, {1: 3, 2: 4}):
+            recipe = Recipe.objects.create(
+                name=f'рецепт {len(cls.recipes)}', text='текст',
+                cooking_time=10, author=cls.author,
+                image='recipes/images/recipe.png', image_hash='hash'
+            )
+            recipe.tags.set([cls.tag])
+            for index, amount in amounts.items():
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=cls.ingredients[index],
+                    amount=amount
+                )
+            cls.recipes.append(recipe)
+
+    def as_user(self, user):
+        self.client.force_authenticate(user)
+        return self.client
+
+    def add_to_cart(self, user, recipe):
+        response = self.as_user(user).post(
+            f'/api/recipes/{recipe.pk}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def fill_carts(self):
+        self.add_to_cart(self.readers[0], self.recipes[0])
+        self.add_to_cart(self.readers[0], self.recipes[1])
+        self.add_to_cart(self.readers[1], self.recipes[1])
+
+    def assert_totals(self):
+        expected = {
+            (row['recipe__shopping_cart__user'], row['ingredient']):
+                row['total']
+            for row in RecipeIngredient.objects.filter(
+                recipe__shopping_cart__isnull=False
+            ).values(
+                'recipe__shopping_cart__user', 'ingredient'
+            ).annotate(total=Sum('amount')).order_by()
+        }
+        self.assertEqual({
+            (item.user_id, item.ingredient_id): item.total_amount
+            for item in ShoppingListItem.objects.all()
+        }, expected)
+        return expected
+
+    def test_cart_add_remove(self):
+        self.fill_carts()
+        totals = self.assert_totals()
+        self.assertEqual(
+            totals[(self.readers[0].pk, self.ingredients[1].pk)], 5
+        )
+        response = self.as_user(self.readers[0]).delete(
+            f'/api/recipes/{self.recipes[0].pk}/shopping_cart/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_totals()
+
+    def test_recipe_ingredients_edit(self):
+        self.fill_carts()
+        response = self.as_user(self.author).patch(
+            f'/api/recipes/{self.recipes[1].pk}/',
+            {
+                'tags': [self.tag.pk],
+                'ingredients': [
+                    {'id': self.ingredients[1].pk, 'amount': 10},
+                    {'id': self.ingredients[3].pk, 'amount': 7},
+                ],
+                'name': 'рецепт 1', 'text': 'текст', 'cooking_time': 10,
+            },
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        totals = self.assert_totals()
+        self.assertEqual(
+            totals[(self.readers[0].pk, self.ingredients[1].pk)], 12
+        )
+        self.assertNotIn((self.readers[1].pk, self.ingredients[2].pk), totals)
+
+    def test_recipe_delete(self):
+        self.fill_carts()
+        response = self.as_user(self.author).delete(
+            f'/api/recipes/{self.recipes[1].pk}/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(len(self.assert_totals()), 2)
+        self.assertFalse(
+            ShoppingListItem.objects.filter(user=self.readers[1]).exists()
+        )
+
+
+@override_settings(FEED_FANOUT_LIMIT=1)
+class FeedTest(APITestCase):
+    """Лента подписок: разнос по лентам, сборка страницы, отписка."""
+
+    def setUp(self):
+        self.reader, self.other, self.author, self.popular = [
+            User.objects.create_user(
+                username=name, email=f'{name}@foodgram.ru', password='pw'
+            )
+            for name in ('reader', 'other', 'author', 'popular')
+        ]
+        self.follow(self.reader, self.author)
+        self.follow(self.reader, self.popular)
+        # Второй подписчик делает автора популярным: его рецепты не
+        # разносятся по лентам.
+        self.follow(self.other, self.popular)
+        self.recipes = [
+            Recipe.objects.create(
+                name=f'рецепт {i}', text='текст', cooking_time=10,
+                author=(self.author, self.popular)[i % 2],
+                image='recipes/images/recipe.png', image_hash='hash'
+            )
+            for i in range(7)
+        ]
+
+    def follow(self, user, author):
+        self.client.force_authenticate(user)
+        response = self.client.post(f'/api/users/{author.pk}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+
+    def feed_ids(self, user, limit):
+        self.client.force_authenticate(user)
+        ids = []
+        url = f'/api/recipes/feed/?limit={limit}'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), limit)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def newest_first(self, recipes):
+        return [
+            recipe.pk for recipe in sorted(
+                recipes, key=lambda recipe: (recipe.pub_date, recipe.pk),
+                reverse=True
+            )
+        ]
+
+    def test_fan_out_limit(self):
+        self.assertEqual(
+            set(FeedItem.objects.filter(
+                user=self.reader
+            ).values_list('recipe', flat=True)),
+            {recipe.pk for recipe in self.recipes[::2]}
+        )
+        self.assertFalse(FeedItem.objects.filter(user=self.other).exists())
+
+    def test_page_merge(self):
+        for limit in (1, 2, 3, 10):
+            with self.subTest(limit=limit):
+                self.assertEqual(
+                    self.feed_ids(self.reader, limit),
+                    self.newest_first(self.recipes)
+                )
+        self.assertEqual(
+            self.feed_ids(self.other, 2),
+            self.newest_first(self.recipes[1::2])
+        )
+
+    def test_unfollow(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.delete(
+            f'/api/users/{self.author.pk}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(FeedItem.objects.filter(user=self.reader).exists())
+        self.assertEqual(
+            self.feed_ids(self.reader, 2),
+            self.newest_first(self.recipes[1::2])
+        )
+
+    def test_follow_fills_feed(self):
+        newcomer = User.objects.create_user(
+            username='newcomer', email='newcomer@foodgram.ru', password='pw'
+        )
+        self.client.force_authenticate(self.reader)
+        self.client.delete(f'/api/users/{self.author.pk}/subscribe/')
+        self.follow(newcomer, self.author)
+        self.assertEqual(
+            self.feed_ids(newcomer, 3), self.newest_first(self.recipes[::2])
+        )
+
+    def test_invalid_cursor(self):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get('/api/recipes/feed/', {'cursor': 'abc'})
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeSearchTest(APITestCase):
+    """Поиск находит все подходящие рецепты, а не первый из них."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pw'
+        )
+        for name, text in (
+            ('Борщ', 'Свёкла и капуста'),
+            ('Зелёный борщ', 'Щавель'),
+            ('Блины', 'Мука и молоко'),
+            ('Щи', 'Капуста'),
+        ):
+            Recipe.objects.create(
+                name=name, text=text, cooking_time=10, author=author,
+                image='recipes/images/recipe.png', image_hash='hash'
+            )
+
+    def search(self, query):
+        response = self.client.get('/api/recipes/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return {recipe['name'] for recipe in response.data['results']}
+
+    def test_search(self):
+        self.assertEqual(self.search('борщ'), {'Борщ', 'Зелёный борщ'})
+        self.assertEqual(self.search('капуста'), {'Борщ', 'Щи'})
+        self.assertEqual(self.search('пицца'), set())
+
+
+class ReplicaReadTest(APITestCase):
+    """Упавший запрос не оставляет поток читать с реплики."""
+
+    def test_failed_request_restores_database(self):
+        with mock.patch(
+            'foodgram.routers.choose_database', return_value='replica_1'
+        ), mock.patch.object(
+            RecipeViewSet, 'list', side_effect=RuntimeError
+        ):
+            with self.assertRaises(RuntimeError):
+                self.client.get('/api/recipes/')
+        self.assertEqual(ReplicaRouter().db_for_read(Recipe), 'default')
+
+    def test_anonymous_subscriptions(self):
+        response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(response.status_code, 401)
+
+
+class RecipeFreshReadTest(APITestCase):
+    """Только что изменённые рецепты читаются из default, а не с реплики.
+
+    Реплики в тестах нет: чтение с неё падает с ConnectionDoesNotExist.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@foodgram.ru', password='pw'
+        )
+        Recipe.objects.create(
+            name='рецепт', text='текст', cooking_time=10, author=author,
+            image='recipes/images/recipe.png', image_hash='hash'
+        )
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch(
+            'foodgram.routers.choose_database', return_value='replica_1'
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_recent_change(self):
+        # Версия рецептов только что создана.
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_old_change(self):
+        with mock.patch('api.caching.changed_recently', return_value=False):
+            with self.assertRaises(ConnectionDoesNotExist):
+                self.client.get('/api/recipes/')
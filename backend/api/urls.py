@@ -1,9 +1,12 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (FavoriteView, IngredientViewSet, RecipeViewSet,
-                    ShoppingCartDownloadView, ShoppingCartView,
-                    SubscribeCreateDestroyView, SubscribeListView, TagViewSet)
+from .views import (CookableView, FavoriteBulkView, FavoriteView, FeedView,
+                    IngredientViewSet, RecipeViewSet, RecommendedRecipesView,
+                    ShoppingCartBulkView, ShoppingCartDownloadView,
+                    ShoppingCartView, ShoppingListView, SimilarRecipesView,
+                    SubscribeBulkView, SubscribeCreateDestroyView,
+                    SubscribeListView, TagViewSet)
 
 router = DefaultRouter()
 
@@ -15,6 +18,9 @@ urlpatterns = [
     path('users/<int:id>/subscribe/',
          SubscribeCreateDestroyView.as_view(),
          name='create_destroy_subscription'),
+    path('users/subscribe/bulk/',
+         SubscribeBulkView.as_view(),
+         name='subscribe_bulk'),
     path('users/subscriptions/',
          SubscribeListView.as_view(),
          name='subscriptions'),
@@ -24,9 +30,30 @@ urlpatterns = [
     path('recipes/<int:id>/favorite/',
          FavoriteView.as_view(),
          name='favorite'),
+    path('recipes/shopping_cart/bulk/',
+         ShoppingCartBulkView.as_view(),
+         name='shopping_cart_bulk'),
+    path('recipes/favorite/bulk/',
+         FavoriteBulkView.as_view(),
+         name='favorite_bulk'),
     path('recipes/download_shopping_cart/',
          ShoppingCartDownloadView.as_view(),
          name='donwload_cart'),
+    path('recipes/<int:id>/similar/',
+         SimilarRecipesView.as_view(),
+         name='similar'),
+    path('recipes/recommended/',
+         RecommendedRecipesView.as_view(),
+         name='recommended'),
+    path('recipes/cookable/',
+         CookableView.as_view(),
+         name='cookable'),
+    path('recipes/feed/',
+         FeedView.as_view(),
+         name='feed'),
+    path('recipes/shopping_list/',
+         ShoppingListView.as_view(),
+         name='shopping_list'),
     path('', include(router.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken'))
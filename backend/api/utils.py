@@ -1,31 +1,209 @@
+import csv
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connections, transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
+from recipes.models import (Favorite, FeedItem, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingListItem,
+                            StaleRecommendation, count_of)
 from users.models import Follow
-from .serializers import SubscribeCreateDestroySerializer
+from .caching import bump_user_state
+
+User = get_user_model()
+
+# Модель связи: поле с объектом, модель объекта и ответ на повторное
+# добавление.
+TOGGLES = {
+    Follow: ('author', User, 'Подписка уже существует!'),
+    Favorite: ('recipe', Recipe, 'Рецепт уже добавлен в избранное'),
+    ShoppingCart: (
+        'recipe', Recipe, 'Рецепт уже добавлен в список покупок'
+    ),
+}
 
 
 def post_object(serializer, request, id):
-    if serializer == SubscribeCreateDestroySerializer:
-        data = {'user': request.user.id, 'author': id}
-    else:
-        data = {'user': request.user.id, 'recipe': id}
-    serializer = serializer(data=data, context={'request': request})
-    serializer.is_valid(raise_exception=True)
-    serializer.save()
-    return Response(serializer.data, status=status.HTTP_201_CREATED)
+    """Добавляет связь пользователя с объектом id.
+
+    Повторное добавление отсекает уникальное ограничение в БД, а не
+    проверка перед записью: сама связь пишется одним INSERT.
+    """
+    model = serializer.Meta.model
+    field, _, duplicate = TOGGLES[model]
+    serializer = serializer(context={'request': request})
+    try:
+        target = serializer.fields[field].to_internal_value(id)
+        validate = getattr(serializer, f'validate_{field}', None)
+        if validate is not None:
+            target = validate(target)
+    except ValidationError as error:
+        raise ValidationError({field: error.detail})
+    try:
+        with transaction.atomic():
+            instance = model.objects.create(
+                user=request.user, **{field: target}
+            )
+    except IntegrityError:
+        raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [
+            duplicate
+        ]})
+    return Response(
+        serializer.to_representation(instance),
+        status=status.HTTP_201_CREATED
+    )
 
 
 def delete_object(model_1, model_2, request, id):
-    obj = get_object_or_404(model_1, id=id)
-    if model_2 == Follow:
-        subscribe = model_2.objects.filter(user=request.user.id,
-                                           author=obj)
-    else:
-        subscribe = model_2.objects.filter(user=request.user.id,
-                                           recipe=obj)
-    if subscribe.exists():
-        subscribe.delete()
+    """Удаляет связь одним фильтрованным DELETE; объект проверяется,
+    только если удалять было нечего.
+    """
+    field = TOGGLES[model_2][0]
+    deleted, _ = model_2.objects.filter(
+        user=request.user.id, **{f'{field}_id': id}
+    ).delete()
+    if deleted:
         return Response(status=status.HTTP_204_NO_CONTENT)
+    get_object_or_404(model_1, id=id)
     return Response(status=status.HTTP_404_NOT_FOUND)
+
+
+def relations_changed(model, user_id, ids, created):
+    """Побочные эффекты добавления или удаления связей пользователя
+    user_id с объектами ids: при одиночных изменениях их выполняют
+    сигналы, а bulk_create и DELETE из bulk_remove сигналов не отправляют.
+    """
+    # Версия меняется после фиксации, как и в сигналах.
+    transaction.on_commit(lambda: bump_user_state(user_id))
+    if model is Follow:
+        User.objects.filter(pk__in=ids).update(
+            followers_count=count_of(Follow.objects.all(), 'author')
+        )
+        if created:
+            for author_id in ids:
+                FeedItem.objects.follow(user_id, author_id)
+        else:
+            FeedItem.objects.filter(
+                user_id=user_id, recipe__author_id__in=ids
+            ).delete()
+        return
+    if model is Favorite:
+        Recipe.objects.filter(pk__in=ids).update(
+            favorites_count=count_of(Favorite.objects.all(), 'recipe')
+        )
+    else:
+        ShoppingListItem.objects.refresh(
+            [user_id],
+            RecipeIngredient.objects.filter(
+                recipe_id__in=ids
+            ).values('ingredient')
+        )
+    if model is Favorite or settings.RECOMMENDATION_CART_WEIGHT:
+        StaleRecommendation.objects.bulk_create(
+            [StaleRecommendation(recipe_id=pk) for pk in ids],
+            ignore_conflicts=True
+        )
+
+
+def bulk_add(model, user, ids):
+    """Добавляет связи user с объектами ids одним INSERT.
+
+    Несуществующие объекты и уже добавленные связи пропускаются.
+    Возвращает идентификаторы добавленных объектов.
+    """
+    field, target_model, _ = TOGGLES[model]
+    targets = target_model.objects.filter(pk__in=ids).exclude(
+        pk__in=model.objects.filter(user=user).values(field)
+    )
+    if model is Follow:
+        targets = targets.exclude(pk=user.pk)
+    with transaction.atomic():
+        added = set(targets.values_list('pk', flat=True))
+        if added:
+            model.objects.bulk_create(
+                [model(user=user, **{f'{field}_id': pk}) for pk in added],
+                ignore_conflicts=True
+            )
+            relations_changed(model, user.pk, added, created=True)
+    return added
+
+
+def bulk_remove(model, user, ids):
+    """Удаляет связи user с объектами ids одним DELETE.
+
+    Возвращает идентификаторы объектов, связи с которыми были.
+    """
+    field = TOGGLES[model][0]
+    relations = model.objects.filter(user=user, **{f'{field}__in': ids})
+    with transaction.atomic():
+        removed = set(relations.values_list(field, flat=True))
+        if removed:
+            # delete() при подписанных сигналах перечитывает строки и
+            # обрабатывает каждую отдельно; побочные эффекты выполняются
+            # для всех строк разом в relations_changed.
+            connection = connections[relations.db]
+            quote = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'DELETE FROM {} WHERE {} = %s AND {} IN ({})'.format(
+                        quote(model._meta.db_table),
+                        quote(model._meta.get_field('user').column),
+                        quote(model._meta.get_field(field).column),
+                        ', '.join(['%s'] * len(removed))
+                    ),
+                    [user.pk, *removed]
+                )
+            relations_changed(model, user.pk, removed, created=False)
+    return removed
+
+
+class Echo:
+    """Псевдобуфер для csv.writer: возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def shopping_list_txt(ingredients):
+    yield 'Список покупок:'
+    for ingredient in ingredients:
+        yield (
+            f"\n{ingredient['ingredient__name']} "
+            f"({ingredient['ingredient__measurement_unit']}) - "
+            f"{ingredient['sum']}")
+
+
+def shopping_list_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(['name', 'measurement_unit', 'amount'])
+    for ingredient in ingredients:
+        yield writer.writerow([
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['sum']
+        ])
+
+
+def shopping_list_json(ingredients):
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps({
+            'name': ingredient['ingredient__name'],
+            'measurement_unit': ingredient['ingredient__measurement_unit'],
+            'amount': ingredient['sum']
+        }, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_LIST_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', shopping_list_txt),
+    'csv': ('text/csv; charset=utf-8', shopping_list_csv),
+    'json': ('application/json', shopping_list_json),
+}
@@ -1,49 +1,139 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db.models import (BooleanField, F, OuterRef, Prefetch, Subquery,
+                              Sum, Value)
+from django.http import StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django_filters import rest_framework as filters
 from rest_framework import generics, views, viewsets
-from rest_framework.decorators import permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from foodgram.routers import ReplicaReadMixin
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListItem, SimilarRecipe, Tag)
 from users.models import Follow
+from .caching import (CatalogCacheMixin, ConditionalGetMixin,
+                      ingredient_catalog, recipes_version, tag_catalog)
+from .cookable import cookable_index
 from .filters import FilterRecipe, IngredientSearchFilter
+from .paginators import (FeedPagination, RecipeCursorPagination,
+                         recipes_limit)
 from .permissions import IsAuthorOrAdminOrReadOnly
-from .serializers import (FavoriteSerializer, IngredientSerializer,
+from .rows import RECIPE_LIST_FIELDS, SUBSCRIPTION_FIELDS, RecipeRows
+from .serializers import (BulkToggleSerializer, FavoriteSerializer,
+                          IngredientSerializer,
                           RecipeCreateUpdateSerializer, RecipeListSerializer,
-                          ShoppingCartSerializer,
+                          ShoppingCartSerializer, ShoppingListItemSerializer,
                           SubscribeCreateDestroySerializer,
                           SubscribeListSerializer, TagSerializer)
-from .utils import delete_object, post_object
+from .utils import (SHOPPING_LIST_FORMATS, bulk_add, bulk_remove,
+                    delete_object, post_object)
 
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+def get_limit(request):
+    """Число рецептов в ответе рекомендаций: ?limit=, не больше соседей."""
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        raise ValidationError({'limit': 'Ожидается целое число'})
+    return max(1, min(limit, settings.RECOMMENDATION_NEIGHBOURS))
 
+
+def serialize_recipes(request, ids):
+    """Рецепты с идентификаторами ids в том же порядке, как в списке."""
+    order = {pk: index for index, pk in enumerate(ids)}
+    if settings.FAST_LIST_SERIALIZATION:
+        rows = Recipe.objects.with_user_flags(request.user).filter(
+            pk__in=ids
+        ).values(*RECIPE_LIST_FIELDS)
+        return RecipeRows(request).list(
+            sorted(rows, key=lambda row: order[row['id']])
+        )
+    recipes = Recipe.objects.for_list(request.user).filter(pk__in=ids)
+    return RecipeListSerializer(
+        sorted(recipes, key=lambda recipe: order[recipe.pk]),
+        many=True,
+        context={'request': request}
+    ).data
+
+
+class TagViewSet(ReplicaReadMixin, CatalogCacheMixin,
+                 viewsets.ReadOnlyModelViewSet):
+
+    catalog = tag_catalog
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReplicaReadMixin, CatalogCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
 
+    catalog = ingredient_catalog
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (IngredientSearchFilter,)
-    search_fields = ('name',)
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, ConditionalGetMixin,
+                    viewsets.ModelViewSet):
 
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = FilterRecipe
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
+    cursor_pagination_class = RecipeCursorPagination
+
+    @property
+    def paginator(self):
+        # ?pagination=cursor включает keyset-пагинацию; ссылки next/previous
+        # сохраняют этот параметр.
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('pagination') == 'cursor':
+                self._paginator = self.cursor_pagination_class()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
+    def get_queryset(self):
+        return Recipe.objects.for_list(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        if settings.FAST_LIST_SERIALIZATION:
+            build = self.list_rows
+        else:
+            build = super().list
+        return self.conditional_response(
+            request, recipes_version(),
+            lambda: build(request, *args, **kwargs)
+        )
+
+    def list_rows(self, request, *args, **kwargs):
+        rows = self.filter_queryset(
+            Recipe.objects.with_user_flags(request.user)
+        ).values(*RECIPE_LIST_FIELDS)
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(RecipeRows(request).list(list(rows)))
+        return self.get_paginated_response(RecipeRows(request).list(page))
+
+    def retrieve(self, request, *args, **kwargs):
+        # get_object_or_404 из DRF отвечает 404 и на нечисловой pk.
+        recipe = generics.get_object_or_404(
+            Recipe.objects.only('updated_at'), pk=self.kwargs['pk']
+        )
+        return self.conditional_response(
+            request, int(recipe.updated_at.timestamp() * 1000),
+            lambda: super(RecipeViewSet, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -55,12 +145,45 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.save(author=self.request.user)
 
 
-class SubscribeListView(generics.ListAPIView):
+class SubscribeListView(ReplicaReadMixin, generics.ListAPIView):
+
+    permission_classes = (IsAuthenticated,)
+
+    def get_recipes(self):
+        recipes = Recipe.objects.all()
+        limit = recipes_limit(self.request)
+        if limit:
+            # Первые recipes_limit рецептов каждого автора одним запросом.
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:limit]
+            ))
+        return recipes
+
+    def get_queryset(self):
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            # Выборка состоит только из авторов, на которых есть подписка.
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).prefetch_related(
+            Prefetch(
+                'recipes',
+                queryset=self.get_recipes(),
+                to_attr='limited_recipes'
+            )
+        ).order_by('id')
 
     def get(self, request):
-        user = request.user
-        queryset = User.objects.filter(following__user=user)
-        page = self.paginate_queryset(queryset)
+        if settings.FAST_LIST_SERIALIZATION:
+            page = self.paginate_queryset(User.objects.filter(
+                following__user=request.user
+            ).order_by('id').values(*SUBSCRIPTION_FIELDS))
+            return self.get_paginated_response(
+                RecipeRows(request).subscriptions(page, self.get_recipes())
+            )
+        page = self.paginate_queryset(self.get_queryset())
         serializer = SubscribeListSerializer(
             page,
             many=True,
@@ -96,22 +219,167 @@ class ShoppingCartView(views.APIView):
         return delete_object(Recipe, ShoppingCart, request, id)
 
 
+class BulkToggleView(views.APIView):
+    """POST добавляет, DELETE удаляет связи со всеми объектами из ids.
+
+    В ответе — идентификаторы объектов, которые действительно были
+    добавлены или удалены.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    model = None
+
+    def get_ids(self, request):
+        serializer = BulkToggleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return set(serializer.validated_data['ids'])
+
+    def post(self, request):
+        added = bulk_add(self.model, request.user, self.get_ids(request))
+        return Response({'added': sorted(added)})
+
+    def delete(self, request):
+        removed = bulk_remove(
+            self.model, request.user, self.get_ids(request)
+        )
+        return Response({'removed': sorted(removed)})
+
+
+class SubscribeBulkView(BulkToggleView):
+    model = Follow
+
+
+class FavoriteBulkView(BulkToggleView):
+    model = Favorite
+
+
+class ShoppingCartBulkView(BulkToggleView):
+    model = ShoppingCart
+
+
 class ShoppingCartDownloadView(views.APIView):
 
-    @permission_classes([IsAuthenticated])
+    permission_classes = (IsAuthenticated,)
+    chunk_size = 2000
+
+    def perform_content_negotiation(self, request, force=False):
+        # Параметр format выбирает формат файла, а не рендерер DRF.
+        return super().perform_content_negotiation(request, force=True)
+
     def get(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            raise ValidationError({
+                'format': 'Доступные форматы: '
+                          + ', '.join(SHOPPING_LIST_FORMATS)
+            })
+        content_type, render = SHOPPING_LIST_FORMATS[file_format]
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
         ).values(
+            'ingredient__name', 'ingredient__measurement_unit',
+            sum=F('total_amount')
+        ).order_by(
             'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(sum=Sum('amount'))
-        shopping_list = "Список покупок:"
-        for ingredient in ingredients:
-            shopping_list += (
-                f"\n{ingredient['ingredient__name']} "
-                f"({ingredient['ingredient__measurement_unit']}) - "
-                f"{ingredient['sum']}")
-        file = 'shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename="{file}.txt"'
+        ).iterator(chunk_size=self.chunk_size)
+        response = StreamingHttpResponse(
+            render(ingredients), content_type=content_type
+        )
+        file = f'shopping_list.{file_format}'
+        response['Content-Disposition'] = f'attachment; filename="{file}"'
         return response
+
+
+class ShoppingListView(generics.ListAPIView):
+
+    serializer_class = ShoppingListItemSerializer
+    permission_classes = (IsAuthenticated,)
+    pagination_class = None
+
+    def get_queryset(self):
+        return ShoppingListItem.objects.filter(
+            user=self.request.user
+        ).select_related('ingredient').order_by(
+            'ingredient__name', 'ingredient__measurement_unit'
+        )
+
+
+class FeedView(views.APIView):
+    """Рецепты авторов из подписок пользователя, от новых к старым."""
+
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        paginator = FeedPagination()
+        ids = paginator.paginate_feed(request)
+        return paginator.get_paginated_response(
+            serialize_recipes(request, ids)
+        )
+
+
+class CookableView(generics.GenericAPIView):
+    """Рецепты, которые можно приготовить из имеющихся ингредиентов."""
+
+    def get_params(self, request):
+        try:
+            ingredients = [
+                int(pk) for pk in request.query_params.getlist('ingredients')
+            ]
+            max_missing = request.query_params.get('max_missing')
+            if max_missing is not None:
+                max_missing = int(max_missing)
+        except ValueError:
+            raise ValidationError(
+                'ingredients и max_missing должны быть целыми числами'
+            )
+        if not ingredients:
+            raise ValidationError({
+                'ingredients': 'Укажите хотя бы один ингредиент'
+            })
+        return ingredients, max_missing
+
+    def get(self, request):
+        ranked = cookable_index.rank(*self.get_params(request))
+        page = self.paginate_queryset(ranked)
+        # В устаревшем индексе могут быть уже удалённые рецепты: их строк
+        # в data нет, поэтому оценки берутся по id, а не по позиции.
+        scores = {pk: (coverage, missing) for pk, coverage, missing in page}
+        data = serialize_recipes(request, list(scores))
+        for recipe in data:
+            coverage, missing = scores[recipe['id']]
+            recipe['coverage'] = round(coverage, 3)
+            recipe['missing'] = missing
+        return self.get_paginated_response(data)
+
+
+class SimilarRecipesView(views.APIView):
+    """Рецепты, похожие на данный, по модели рекомендаций."""
+
+    def get(self, request, id):
+        recipe = get_object_or_404(Recipe, id=id)
+        ids = SimilarRecipe.objects.filter(recipe=recipe).order_by(
+            '-score'
+        ).values_list('similar', flat=True)[:get_limit(request)]
+        return Response(serialize_recipes(request, list(ids)))
+
+
+class RecommendedRecipesView(views.APIView):
+    """Рецепты, похожие на последние добавленные в избранное."""
+
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        favorites = Favorite.objects.filter(user=request.user)
+        seeds = favorites.order_by('-pk').values_list(
+            'recipe', flat=True
+        )[:settings.RECOMMENDATION_SEEDS]
+        ids = SimilarRecipe.objects.filter(
+            recipe__in=list(seeds)
+        ).exclude(
+            similar__in=favorites.values('recipe')
+        ).values('similar').annotate(
+            total=Sum('score')
+        ).order_by('-total', '-similar').values_list(
+            'similar', flat=True
+        )[:get_limit(request)]
+        return Response(serialize_recipes(request, list(ids)))
@@ -0,0 +1,195 @@
+"""ASGI-точка входа: gunicorn -k uvicorn.workers.UvicornWorker.
+
+В Django 2.2 нет ни ASGI-обработчика, ни асинхронных представлений,
+поэтому представления выполняются как обычно, в пуле из ASGI_THREADS
+потоков. Цикл событий тем временем принимает тело запроса и отдаёт
+ответ: медленный клиент (загрузка картинки в base64, скачивание списка
+покупок) держит только сокет, а не поток или процесс воркера.
+
+Ответ передаётся из потока в цикл событий через очередь из нескольких
+блоков по block_size байт, поэтому потоковый ответ (список покупок)
+отдаётся по мере чтения и не собирается в памяти целиком. Поток ждёт,
+пока клиент не заберёт очередной блок, только если ответ больше очереди.
+"""
+import asyncio
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+
+
+class ASGIHandler:
+    """ASGI-приложение поверх WSGI-приложения Django."""
+
+    block_size = 2 ** 16
+    queue_size = 8
+
+    def __init__(self, wsgi_application, threads):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix='asgi'
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Неподдерживаемый тип {scope["type"]}')
+        loop = asyncio.get_running_loop()
+        with SpooledTemporaryFile(max_size=2 ** 16) as body:
+            while True:
+                message = await receive()
+                if message['type'] == 'http.disconnect':
+                    return
+                body.write(message.get('body', b''))
+                if not message.get('more_body'):
+                    break
+            body.seek(0)
+            messages = asyncio.Queue(maxsize=self.queue_size)
+            closed = threading.Event()
+            worker = loop.run_in_executor(
+                self.executor, self.run, self.build_environ(scope, body),
+                loop, messages, closed
+            )
+            # Отправка отключившемуся клиенту не вызывает ошибки: об
+            # отключении сообщает только receive().
+            disconnect = asyncio.ensure_future(self.wait_disconnect(receive))
+            try:
+                while not disconnect.done():
+                    message = await self.next_message(messages, worker)
+                    if message is None:
+                        break
+                    await send(message)
+            finally:
+                # Клиент отключился или ответ отправлен: поток перестаёт
+                # читать ответ, а очередь разбирается, чтобы он не ждал.
+                disconnect.cancel()
+                closed.set()
+                while await self.next_message(messages, worker) is not None:
+                    pass
+        await worker
+
+    async def wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def next_message(self, messages, worker):
+        """Следующее сообщение из потока или None, если он завершился."""
+        getter = asyncio.ensure_future(messages.get())
+        await asyncio.wait(
+            {getter, worker}, return_when=asyncio.FIRST_COMPLETED
+        )
+        if getter.done():
+            return getter.result()
+        getter.cancel()
+        if not messages.empty():
+            return messages.get_nowait()
+        return None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def build_environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'].encode().decode('latin1'),
+            'QUERY_STRING': scope['query_string'].decode('latin1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1] or 80),
+            'SERVER_PROTOCOL': f'HTTP/{scope["http_version"]}',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for name, value in scope['headers']:
+            name = name.decode('latin1').upper().replace('-', '_')
+            if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+                name = f'HTTP_{name}'
+            value = value.decode('latin1')
+            if name in environ:
+                value = f'{environ[name]},{value}'
+            environ[name] = value
+        return environ
+
+    def run(self, environ, loop, messages, closed):
+        """Выполняет запрос в потоке пула и передаёт ответ в очередь.
+
+        Потоковый ответ тоже читается здесь: его генератор может держать
+        курсор БД, привязанный к этому потоку. Мелкие части ответа
+        собираются в блоки по block_size байт.
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin1'), value.encode('latin1'))
+                for name, value in headers
+            ]
+
+        def put(message):
+            asyncio.run_coroutine_threadsafe(
+                messages.put(message), loop
+            ).result()
+
+        def put_body(block):
+            put({
+                'type': 'http.response.body',
+                'body': bytes(block),
+                'more_body': True,
+            })
+
+        try:
+            result = self.wsgi_application(environ, start_response)
+            try:
+                put({
+                    'type': 'http.response.start',
+                    'status': response['status'],
+                    'headers': response['headers'],
+                })
+                block = bytearray()
+                for chunk in result:
+                    if closed.is_set():
+                        break
+                    block += chunk
+                    if len(block) >= self.block_size:
+                        put_body(block)
+                        block.clear()
+                else:
+                    if block:
+                        put_body(block)
+                    put({'type': 'http.response.body'})
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            put(None)
+
+
+def get_asgi_application():
+    wsgi_application = get_wsgi_application()
+    return ASGIHandler(wsgi_application, settings.ASGI_THREADS)
+
+
+application = get_asgi_application()
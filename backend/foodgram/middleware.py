@@ -0,0 +1,151 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .routers import SAFE_METHODS, pin_to_primary, replica_aliases
+
+logger = logging.getLogger('foodgram.requests')
+
+# Списки параметров IN (%s, %s, ...) сводятся к одной форме запроса.
+PARAMS_LIST = re.compile(r'\((?:%s, )+%s\)')
+
+
+class QueryCollector:
+    """Обёртка execute_wrapper: считает запросы, их время и формы."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[PARAMS_LIST.sub('(%s...)', sql)] += 1
+
+
+class RequestInstrumentationMiddleware:
+    """Замеряет запросы к БД и время обработки каждого запроса.
+
+    Результат отдаётся в заголовке Server-Timing и пишется в лог
+    foodgram.requests одной JSON-строкой. Включается настройкой
+    REQUEST_INSTRUMENTATION.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = QueryCollector()
+        request._instrumentation = {'collector': collector}
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+        self.report(request, response, collector, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._instrumentation['view_started'] = time.perf_counter()
+        request._instrumentation['view_db'] = (
+            request._instrumentation['collector'].duration
+        )
+
+    def process_template_response(self, request, response):
+        # Ответы DRF рендерятся после выхода из представления.
+        state = request._instrumentation
+        state['view_finished'] = time.perf_counter()
+
+        def finish_render(response):
+            state['render'] = time.perf_counter() - state['view_finished']
+
+        response.add_post_render_callback(finish_render)
+        return response
+
+    def report(self, request, response, collector, total):
+        state = request._instrumentation
+        metrics = {
+            'db': collector.duration,
+            'total': total,
+        }
+        if 'view_started' in state:
+            finished = state.get('view_finished', time.perf_counter())
+            view_db = collector.duration - state['view_db']
+            metrics['view'] = max(
+                finished - state['view_started'] - view_db, 0
+            )
+        if 'render' in state:
+            metrics['render'] = state['render']
+        repeated_sql, repeats = (
+            collector.shapes.most_common(1)[0] if collector.shapes
+            else (None, 0)
+        )
+        over_budget = collector.count > settings.REQUEST_QUERY_BUDGET
+        n_plus_one = repeats >= settings.REQUEST_REPEATED_QUERY_LIMIT
+        response['Server-Timing'] = ', '.join(
+            [f'db;dur={metrics["db"] * 1000:.2f};'
+             f'desc="{collector.count} queries"']
+            + [f'{name};dur={metrics[name] * 1000:.2f}'
+               for name in ('view', 'render', 'total') if name in metrics]
+        )
+        record = {
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'queries': collector.count,
+            'response_bytes': (
+                None if response.streaming else len(response.content)
+            ),
+            **{f'{name}_ms': round(value * 1000, 2)
+               for name, value in metrics.items()},
+        }
+        if over_budget or n_plus_one:
+            record.update(
+                over_budget=over_budget,
+                n_plus_one=n_plus_one,
+                repeated_query=repeated_sql if n_plus_one else None,
+                repeats=repeats,
+            )
+            logger.warning(json.dumps(record, ensure_ascii=False))
+        else:
+            logger.info(json.dumps(record, ensure_ascii=False))
+
+
+class PrimaryPinMiddleware:
+    """После записи пользователь REPLICA_PIN_SECONDS читает из default.
+
+    Иначе, например, добавив рецепт в избранное, он мог бы сразу получить
+    с отстающей реплики список без него. Работает, только если настроены
+    реплики.
+    """
+
+    def __init__(self, get_response):
+        if not replica_aliases():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # Пользователя, вошедшего по токену, DRF записывает в request.user
+        # во время обработки запроса.
+        if (
+            request.method not in SAFE_METHODS
+            and request.user.is_authenticated
+        ):
+            pin_to_primary(request.user.pk)
+        return response
@@ -0,0 +1,130 @@
+"""PostgreSQL с пулом соединений внутри процесса (ENGINE = 'foodgram.pool').
+
+Закрытое Django соединение возвращается в пул, а не разрывается, поэтому
+потоки ASGI-режима и многопоточного gunicorn делят не больше POOL_SIZE
+соединений процесса с сервером. Если свободного соединения нет, поток
+ждёт его до POOL_TIMEOUT секунд. При CONN_HEALTH_CHECKS соединение из
+пула проверяется запросом SELECT 1 перед выдачей. Django возвращает
+соединение в пул в конце запроса и берёт его при первом обращении к БД,
+поэтому проверка выполняется не больше раза за запрос и только если
+запрос обращается к БД.
+"""
+import os
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+Database = base.Database
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def is_alive(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+class ConnectionPool:
+    """Не больше size соединений, выданных и свободных вместе."""
+
+    def __init__(self, size, timeout, conn_params):
+        self.timeout = timeout
+        self.conn_params = conn_params
+        self.slots = threading.BoundedSemaphore(size)
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def get(self):
+        """Возвращает пару (соединение, взято ли оно из свободных)."""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise Database.OperationalError(
+                f'Нет свободного соединения в пуле за {self.timeout} с'
+            )
+        try:
+            with self.lock:
+                if self.idle:
+                    return self.idle.pop(), True
+            return Database.connect(**self.conn_params), False
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def put(self, connection):
+        try:
+            status = (
+                extensions.TRANSACTION_STATUS_UNKNOWN if connection.closed
+                else connection.info.transaction_status
+            )
+            if status != extensions.TRANSACTION_STATUS_UNKNOWN:
+                if status != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+                with self.lock:
+                    self.idle.append(connection)
+                return
+            connection.close()
+        except Database.Error:
+            connection.close()
+        finally:
+            self.slots.release()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        finally:
+            self.slots.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, settings_dict, alias):
+        # Соединения живут в пуле, а не в потоке между запросами.
+        super().__init__({**settings_dict, 'CONN_MAX_AGE': 0}, alias)
+        self.pool = None
+
+    def get_pool(self, conn_params):
+        # После fork у воркера gunicorn должен быть свой пул.
+        key = (os.getpid(), self.alias)
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = ConnectionPool(
+                    self.settings_dict.get('POOL_SIZE', 10),
+                    self.settings_dict.get('POOL_TIMEOUT', 10),
+                    conn_params
+                )
+            return _pools[key]
+
+    def get_new_connection(self, conn_params):
+        self.pool = self.get_pool(conn_params)
+        while True:
+            connection, reused = self.pool.get()
+            if not (
+                reused
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')
+                and not is_alive(connection)
+            ):
+                break
+            self.pool.discard(connection)
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            if self.errors_occurred:
+                self.pool.discard(self.connection)
+            else:
+                self.pool.put(self.connection)
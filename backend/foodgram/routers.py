@@ -0,0 +1,176 @@
+"""Чтение с реплик БД.
+
+Реплики — базы из DATABASES с ключом REPLICA (переменная DB_REPLICAS).
+Представления с ReplicaReadMixin читают с реплики безопасные запросы,
+всё остальное, в том числе любые записи, идёт в default. Пользователь,
+который только что что-то записал, ещё REPLICA_PIN_SECONDS читает из
+default и видит свои изменения. Реплика, отстающая больше чем на
+REPLICA_MAX_LAG секунд или недоступная, пропускается до следующей
+проверки; если подходящих реплик нет, чтение идёт в default.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+PRIMARY = 'default'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Отставание в секундах. Реплика, которая догнала мастер, считается
+# неотстающей, даже если последняя транзакция была давно.
+LAG_SQL = {
+    'postgresql': '''
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery()
+                OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+            THEN 0
+            ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+        END
+    ''',
+}
+
+_state = threading.local()
+
+
+def replica_aliases():
+    return [
+        alias for alias, options in settings.DATABASES.items()
+        if options.get('REPLICA')
+    ]
+
+
+def pinned_key(user_id):
+    return f'user:{user_id}:primary'
+
+
+def pin_to_primary(user_id):
+    """Направляет чтение пользователя в default на REPLICA_PIN_SECONDS."""
+    cache.set(pinned_key(user_id), True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return user.is_authenticated and bool(cache.get(pinned_key(user.pk)))
+
+
+class ReplicaMonitor:
+    """Реплики, годные для чтения; проверяются не чаще раза
+    в REPLICA_CHECK_INTERVAL секунд в каждом процессе.
+
+    Реплики проверяет один поток и без блокировки: остальные запросы
+    тем временем получают результат прошлой проверки и не ждут
+    недоступную реплику.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._checking = False
+        self._available = []
+
+    def lag(self, alias):
+        """Отставание реплики в секундах или None, если она недоступна."""
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL.get(connection.vendor, 'SELECT 0'))
+                return float(cursor.fetchone()[0] or 0)
+        except DatabaseError:
+            connection.close()
+            return None
+
+    def check(self):
+        available = []
+        for alias in replica_aliases():
+            lag = self.lag(alias)
+            if lag is not None and lag <= settings.REPLICA_MAX_LAG:
+                available.append(alias)
+        return available
+
+    def available(self):
+        with self._lock:
+            if self._checking or (
+                self._checked_at is not None
+                and time.monotonic() - self._checked_at
+                < settings.REPLICA_CHECK_INTERVAL
+            ):
+                return self._available
+            self._checking = True
+        available = self._available
+        try:
+            available = self.check()
+        finally:
+            with self._lock:
+                self._available = available
+                self._checked_at = time.monotonic()
+                self._checking = False
+        return available
+
+
+replica_monitor = ReplicaMonitor()
+
+
+def choose_database(user):
+    """База для чтения в безопасном запросе пользователя user."""
+    if not replica_aliases() or is_pinned(user):
+        return PRIMARY
+    available = replica_monitor.available()
+    return random.choice(available) if available else PRIMARY
+
+
+def set_read_database(alias):
+    """Назначает базу для чтения в текущем потоке; возвращает прежнюю."""
+    previous = getattr(_state, 'database', PRIMARY)
+    _state.database = alias
+    return previous
+
+
+@contextmanager
+def read_from(alias):
+    previous = set_read_database(alias)
+    try:
+        yield
+    finally:
+        set_read_database(previous)
+
+
+def read_from_primary():
+    return read_from(PRIMARY)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'database', PRIMARY)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return not settings.DATABASES[db].get('REPLICA')
+
+
+class ReplicaReadMixin:
+    """Безопасные запросы представления читают с реплики.
+
+    Аутентификация и проверка прав выполняются по default: токен только
+    что вошедшего пользователя может ещё не дойти до реплики.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        # Прежняя база восстанавливается и после необработанного
+        # исключения, иначе поток продолжил бы читать с реплики.
+        with read_from(getattr(_state, 'database', PRIMARY)):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            set_read_database(choose_database(request.user))
@@ -34,8 +34,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'foodgram.middleware.PrimaryPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'foodgram.middleware.RequestInstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -67,9 +69,110 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default=None),
         'HOST': os.getenv('DB_HOST', default=None),
         'PORT': os.getenv('DB_PORT', default=None),
+        # Секунд, которые соединение живёт между запросами; 0 — новое
+        # соединение на каждый запрос.
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        # Проверять соединение из пула перед выдачей (ENGINE =
+        # 'foodgram.pool'). У стандартного бэкенда Django 2.2 проверки нет:
+        # соединение, закрытое сервером, даёт ошибку в одном запросе,
+        # после чего Django его закрывает.
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', default='True'
+        ) == 'True',
+        # Нужно за PgBouncer в режиме pool_mode = transaction.
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_DISABLE_SERVER_SIDE_CURSORS', default='False'
+        ) == 'True',
+        # Только для ENGINE = 'foodgram.pool'.
+        'POOL_SIZE': int(os.getenv('DB_POOL_SIZE', default=10)),
+        'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
     }
 }
 
+# Реплики для чтения через запятую: host[:port] или name@host[:port];
+# для SQLite — путь@.
+# Недоступная реплика не должна задерживать запрос, который её проверяет.
+REPLICA_CONNECT_TIMEOUT = int(
+    os.getenv('DB_REPLICA_CONNECT_TIMEOUT', default=2)
+)
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', default='').split(',')), 1
+):
+    name, _, address = replica.strip().rpartition('@')
+    host, _, port = address.partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'NAME': name or DATABASES['default']['NAME'],
+        'HOST': host or DATABASES['default']['HOST'],
+        'PORT': port or DATABASES['default']['PORT'],
+        'REPLICA': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+    if 'sqlite3' not in DATABASES['default']['ENGINE']:
+        DATABASES[f'replica_{number}']['OPTIONS'] = {
+            'connect_timeout': REPLICA_CONNECT_TIMEOUT,
+        }
+
+DATABASE_ROUTERS = ['foodgram.routers.ReplicaRouter']
+
+# Сколько секунд после записи пользователь читает из default.
+REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', default=10))
+
+# Реплика, отстающая больше, не используется до следующей проверки.
+REPLICA_MAX_LAG = float(os.getenv('DB_REPLICA_MAX_LAG', default=2))
+
+REPLICA_CHECK_INTERVAL = 5
+
+# В кеше хранятся версии справочников, рецептов и состояния
+# пользователей. Кеш по умолчанию (LocMemCache) у каждого процесса свой:
+# изменения, сделанные другим воркером или командами load_ingredients
+# и seed_foodgram, процесс сервера увидит, только когда его версия
+# устареет через CACHE_VERSION_TIMEOUT секунд. В продакшене нужен общий
+# кеш: CACHE_BACKEND и CACHE_LOCATION для Redis или Memcached.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
+    }
+}
+
+LOCAL_CACHE = CACHES['default']['BACKEND'] in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# В общем кеше версии хранятся бессрочно.
+CACHE_VERSION_TIMEOUT = int(
+    os.getenv('CACHE_VERSION_TIMEOUT', default=60)
+) if LOCAL_CACHE else None
+
+REQUEST_INSTRUMENTATION = os.getenv(
+    'REQUEST_INSTRUMENTATION', default='False'
+) == 'True'
+
+REQUEST_QUERY_BUDGET = 20
+
+REQUEST_REPEATED_QUERY_LIMIT = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.requests': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -106,18 +209,50 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 AUTH_USER_MODEL = 'users.User'
 
+RECIPE_IMAGE_MAX_SIZE = 7 * 1024 * 1024
+
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.paginators.PaginationWithLimit',
     'PAGE_SIZE': 6,
 }
 
+INGREDIENT_SEARCH_LIMIT = 20
+
+# Наибольшее число объектов в одном запросе к .../bulk/.
+BULK_TOGGLE_LIMIT = 100
+
+# Рецепты авторов с большим числом подписчиков не разносятся по лентам,
+# а читаются при сборке страницы.
+FEED_FANOUT_LIMIT = int(os.getenv('FEED_FANOUT_LIMIT', 1000))
+
+# Потоки, в которых foodgram.asgi выполняет представления.
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 20))
+
+# Модель похожих рецептов (manage.py build_recommendations).
+RECOMMENDATION_NEIGHBOURS = 20
+RECOMMENDATION_CART_WEIGHT = 0.5
+RECOMMENDATION_BASKET_LIMIT = 200
+RECOMMENDATION_SEEDS = 20
+
+# Списки рецептов и подписок сериализуются из строк .values(),
+# минуя ModelSerializer; ответ не меняется.
+FAST_LIST_SERIALIZATION = True
+
+CATALOG_CACHE_SIZE = 256
+
+TOKEN_CACHE_TIMEOUT = 300
+
+TOKEN_CACHE_LOCAL_TIMEOUT = 5
+
 SIMPLE_JWT = {
    'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
    'AUTH_HEADER_TYPES': ('Bearer',),
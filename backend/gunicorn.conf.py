@@ -0,0 +1,8 @@
+import os
+
+bind = '0:8000'
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+
+# SERVER_MODE=asgi: foodgram.asgi под воркерами uvicorn.
+if os.getenv('SERVER_MODE') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
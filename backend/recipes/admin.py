@@ -1,7 +1,6 @@
 from django.contrib import admin
 
-from .models import (Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag,
-                     Tag)
+from .models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
 
 EMPTY = '-пусто-'
 
@@ -29,8 +28,12 @@ class RecipeAdmin(admin.ModelAdmin):
     empty_value_display = EMPTY
     inlines = [IngredientInline, TagInline]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('author')
+
     def favorites(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
+    favorites.admin_order_field = 'favorites_count'
 
 
 class IngredientAdmin(admin.ModelAdmin):
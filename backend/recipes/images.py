@@ -0,0 +1,121 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.dispatch import Signal
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/variants/'
+SIZES = {
+    'thumbnail': (480, 480),
+    'medium': (1200, 1200),
+}
+
+_executor = None
+
+# Отправляется, когда варианты изображения рецепта recipe_id построены.
+image_processed = Signal()
+
+
+def variant_name(image_hash, size, image_format):
+    return f'{VARIANTS_DIR}{image_hash}_{size}.{image_format}'
+
+
+def variant_names(image_hash):
+    """Пути вариантов изображения: {размер: {формат: путь}}."""
+    return {
+        size: {
+            image_format: variant_name(image_hash, size, image_format)
+            for image_format in ('webp', 'jpeg')
+        }
+        for size in SIZES
+    }
+
+
+def file_hash(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+def save_variant(image, name, image_format):
+    if default_storage.exists(name):
+        return
+    buffer = io.BytesIO()
+    if image_format == 'webp':
+        image.save(buffer, 'WEBP', quality=80, method=4)
+    else:
+        image.convert('RGB').save(
+            buffer, 'JPEG', quality=85, optimize=True, progressive=True
+        )
+    default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def process_recipe_image(recipe_id):
+    """Строит уменьшенные копии изображения рецепта в JPEG и WebP.
+
+    Имена файлов содержат хеш исходного изображения, поэтому их можно
+    кешировать навсегда, а повторная обработка ничего не перезаписывает.
+    """
+    from .models import Recipe
+
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    with recipe.image.open('rb') as file:
+        image_hash = file_hash(file)
+        file.seek(0)
+        source = ImageOps.exif_transpose(Image.open(file))
+        if source.mode not in ('RGB', 'RGBA'):
+            source = source.convert('RGBA')
+        for size, dimensions in SIZES.items():
+            image = source.copy()
+            image.thumbnail(dimensions, Image.LANCZOS)
+            for image_format, name in variant_names(image_hash)[size].items():
+                save_variant(image, name, image_format)
+    # updated_at меняется вместе с хешем: ответ с вариантами получает
+    # новый ETag.
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=recipe.image.name
+    ).update(image_hash=image_hash, updated_at=timezone.now())
+    if updated:
+        image_processed.send(sender=Recipe, recipe_id=recipe_id)
+
+
+def _process_safely(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    except Exception:
+        logger.exception('Не удалось обработать изображение рецепта %s',
+                         recipe_id)
+
+
+def _process_in_worker(recipe_id):
+    try:
+        _process_safely(recipe_id)
+    finally:
+        # Соединения с БД потоков пула не закрываются Django сами.
+        connections.close_all()
+
+
+def schedule_recipe_image(recipe_id):
+    """Отправляет обработку в пул потоков (или выполняет сразу)."""
+    global _executor
+    workers = settings.IMAGE_PROCESSING_WORKERS
+    if not workers:
+        _process_safely(recipe_id)
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='recipe-images'
+        )
+    _executor.submit(_process_in_worker, recipe_id)
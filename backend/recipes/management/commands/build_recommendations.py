@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.recommendations import rebuild, update
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит модель похожих рецептов по избранному и спискам покупок '
+        '(запускается по расписанию)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--incremental', action='store_true',
+            help='Пересчитать только рецепты, избранное которых менялось'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['incremental']:
+            count = update()
+        else:
+            count = rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {count} '
+            f'за {time.perf_counter() - started:.1f} с'
+        ))
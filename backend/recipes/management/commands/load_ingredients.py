@@ -0,0 +1,182 @@
+import csv
+import io
+import json
+import os
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipes.models import Ingredient
+from recipes.signals import bulk_loaded
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """Потоково разбирает JSON-массив, не загружая файл целиком.
+
+    Понимает как список {"name", "measurement_unit"}, так и фикстуру
+    Django с полем "fields".
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if not started and buffer[position:position + 1] == '[':
+                started = True
+                position += 1
+                continue
+            if buffer[position:position + 1] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if not chunk:
+                    raise CommandError('Некорректный JSON-файл')
+                break
+            item = item.get('fields', item)
+            yield item['name'], item['measurement_unit']
+        buffer = buffer[position:]
+        if not chunk:
+            return
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def unique_rows(rows):
+    seen = set()
+    for name, measurement_unit in rows:
+        key = (name.strip(), measurement_unit.strip())
+        if key[0] and key not in seen:
+            seen.add(key)
+            yield key
+
+
+class RowsStream(io.TextIOBase):
+    """Файлоподобный поток CSV-строк для COPY."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ''
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator='\n')
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            writer.writerow(row)
+            self.count += 1
+            self.buffer += output.getvalue()
+            output.seek(0)
+            output.truncate()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV- или JSON-файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файлов (по умолчанию — по расширению)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Размер пакета для bulk_create'
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY даже на PostgreSQL'
+        )
+
+    def read(self, paths, file_format):
+        for path in paths:
+            reader = READERS.get(
+                file_format or os.path.splitext(path)[1].lstrip('.').lower()
+            )
+            if reader is None:
+                raise CommandError(f'Неизвестный формат файла: {path}')
+            with open(path, encoding='utf-8') as file:
+                yield from reader(file)
+
+    def bulk_create(self, rows, batch_size):
+        count = 0
+        while True:
+            batch = [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in islice(rows, batch_size)
+            ]
+            if not batch:
+                return count
+            Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
+
+    def copy(self, rows):
+        stream = RowsStream(rows)
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                'COPY ingredient_import FROM STDIN WITH (FORMAT csv)', stream
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredient_import '
+                'ON CONFLICT DO NOTHING'
+            )
+        return stream.count
+
+    def handle(self, *args, **options):
+        rows = unique_rows(self.read(options['paths'], options['format']))
+        use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        before = Ingredient.objects.count()
+        started = time.monotonic()
+        with transaction.atomic():
+            if use_copy:
+                processed = self.copy(rows)
+            else:
+                processed = self.bulk_create(rows, options['batch_size'])
+        elapsed = time.monotonic() - started
+        created = Ingredient.objects.count() - before
+        bulk_loaded.send(sender=Ingredient)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {processed}, добавлено: {created}, '
+            f'{processed / elapsed if elapsed else processed:.0f} строк/с'
+        ))
+        if settings.LOCAL_CACHE:
+            self.stderr.write(self.style.WARNING(
+                'Кеш не общий (CACHE_BACKEND): запущенные серверы увидят '
+                'новые ингредиенты не раньше чем через '
+                f'{settings.CACHE_VERSION_TIMEOUT} с'
+            ))
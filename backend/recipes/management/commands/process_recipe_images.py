@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Строит варианты изображений для рецептов, у которых их нет'
+
+    def handle(self, *args, **options):
+        recipe_ids = Recipe.objects.filter(
+            image_hash=''
+        ).exclude(image='').values_list('pk', flat=True)
+        processed = 0
+        for recipe_id in recipe_ids.iterator():
+            process_recipe_image(recipe_id)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {processed}'
+        ))
@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import (Favorite, FeedItem, Ingredient, Recipe,
+                            ShoppingListItem, count_of)
+from recipes.search import update_search_index
+from users.models import Follow
+
+User = get_user_model()
+
+
+def recount():
+    with transaction.atomic():
+        recipes = Recipe.objects.update(
+            favorites_count=count_of(Favorite.objects.all(), 'recipe')
+        )
+        users = User.objects.update(
+            recipes_count=count_of(Recipe.objects.all(), 'author'),
+            followers_count=count_of(Follow.objects.all(), 'author')
+        )
+        ShoppingListItem.objects.refresh(
+            User.objects.values('pk'), Ingredient.objects.values('pk')
+        )
+        FeedItem.objects.rebuild()
+        update_search_index()
+    return recipes, users
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, рецептов и подписчиков '
+            'и заново строит списки покупок, ленты подписок '
+            'и поисковый индекс')
+
+    def handle(self, *args, **options):
+        recipes, users = recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {recipes}, пользователей: {users}'
+        ))
@@ -0,0 +1,227 @@
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from PIL import Image
+
+from recipes.images import process_recipe_image
+from recipes.management.commands.recount import recount
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            RecipeTag, ShoppingCart, Tag)
+from recipes.signals import bulk_loaded
+from users.models import Follow
+
+User = get_user_model()
+
+SEED_IMAGE = 'recipes/images/seed.png'
+SEED_PASSWORD = 'foodgram-seed'
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+
+
+def power_law_weights(count, alpha):
+    """Накопленные веса распределения Ципфа для random.choices."""
+    return list(accumulate(1 / (rank + 1) ** alpha for rank in range(count)))
+
+
+def batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу синтетическими пользователями, рецептами и связями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок на пользователя'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=30,
+            help='Среднее число рецептов в избранном у пользователя'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=5,
+            help='Среднее число рецептов в списке покупок у пользователя'
+        )
+        parser.add_argument(
+            '--alpha', type=float, default=1.1,
+            help='Показатель степенного распределения популярности'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def log(self, message):
+        self.stdout.write(
+            f'[{time.monotonic() - self.started:7.1f} с] {message}'
+        )
+
+    def bulk_create(self, model, objects):
+        for batch in batches(objects, self.batch_size):
+            model.objects.bulk_create(batch, ignore_conflicts=True)
+
+    def handle(self, *args, **options):
+        self.started = time.monotonic()
+        self.batch_size = options['batch_size']
+        rng = random.Random(options['seed'])
+        ingredient_ids = list(Ingredient.objects.values_list('pk', flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                'Нет ингредиентов: сначала выполните load_ingredients'
+            )
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+
+        user_ids = self.create_users(options['users'])
+        self.log(f'Пользователей: {len(user_ids)}')
+        popularity = power_law_weights(len(user_ids), options['alpha'])
+
+        recipe_ids = self.create_recipes(
+            options['recipes'], user_ids, popularity, rng
+        )
+        self.log(f'Рецептов: {len(recipe_ids)}')
+        self.create_recipe_relations(recipe_ids, ingredient_ids, tag_ids, rng)
+        self.log('Ингредиенты и теги рецептов добавлены')
+
+        self.bulk_create(Follow, [
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id in user_ids
+            for author_id in self.sample(
+                user_ids, popularity, options['follows'], rng
+            )
+            if author_id != user_id
+        ])
+        self.log('Подписки добавлены')
+
+        recipe_popularity = power_law_weights(
+            len(recipe_ids), options['alpha']
+        )
+        for model, average in ((Favorite, options['favorites']),
+                               (ShoppingCart, options['cart'])):
+            self.bulk_create(model, [
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_ids
+                for recipe_id in self.sample(
+                    recipe_ids, recipe_popularity, average, rng
+                )
+            ])
+        self.log('Избранное и списки покупок добавлены')
+
+        recount()
+        for model in (Recipe, RecipeIngredient, RecipeTag):
+            bulk_loaded.send(sender=model)
+        self.log('Счётчики пересчитаны')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово. Пароль пользователей: {SEED_PASSWORD}'
+        ))
+        if settings.LOCAL_CACHE:
+            self.stderr.write(self.style.WARNING(
+                'Кеш не общий (CACHE_BACKEND): запущенные серверы увидят '
+                'новые рецепты не раньше чем через '
+                f'{settings.CACHE_VERSION_TIMEOUT} с'
+            ))
+
+    def sample(self, population, cum_weights, average, rng):
+        """Случайное подмножество со средним размером average."""
+        size = min(int(rng.expovariate(1 / average)), len(population))
+        return set(rng.choices(population, cum_weights=cum_weights, k=size))
+
+    def create_users(self, count):
+        password = make_password(SEED_PASSWORD)
+        start = User.objects.count()
+        users = [
+            User(
+                username=f'seed{number}',
+                email=f'seed{number}@example.org',
+                first_name='Пользователь',
+                last_name=str(number),
+                password=password
+            )
+            for number in range(start, start + count)
+        ]
+        self.bulk_create(User, users)
+        return list(User.objects.filter(
+            username__startswith='seed'
+        ).values_list('pk', flat=True))
+
+    def seed_image(self):
+        if not default_storage.exists(SEED_IMAGE):
+            buffer = io.BytesIO()
+            Image.new('RGB', (1200, 800), '#E26C2D').save(buffer, 'PNG')
+            default_storage.save(SEED_IMAGE, ContentFile(buffer.getvalue()))
+        return SEED_IMAGE
+
+    def create_recipes(self, count, user_ids, popularity, rng):
+        image = self.seed_image()
+        last_id = Recipe.objects.order_by('-pk').values_list(
+            'pk', flat=True
+        ).first() or 0
+        recipes = [
+            Recipe(
+                name=f'Рецепт {number}',
+                text='Синтетический рецепт для нагрузочного тестирования.',
+                author_id=author_id,
+                image=image,
+                cooking_time=rng.randint(5, 180)
+            )
+            for number, author_id in enumerate(
+                rng.choices(user_ids, cum_weights=popularity, k=count)
+            )
+        ]
+        self.bulk_create(Recipe, recipes)
+        created = list(Recipe.objects.filter(pk__gt=last_id).order_by('pk'))
+        # auto_now_add проставляет всем одно время: разносим даты
+        # публикации, чтобы лента и курсорная пагинация были реалистичны.
+        now = timezone.now()
+        for position, recipe in enumerate(reversed(created)):
+            recipe.pub_date = now - timedelta(minutes=10 * position)
+        for batch in batches(created, self.batch_size):
+            Recipe.objects.bulk_update(batch, ['pub_date'])
+        if created:
+            process_recipe_image(created[0].pk)
+            image_hash = Recipe.objects.get(pk=created[0].pk).image_hash
+            Recipe.objects.filter(
+                pk__gt=last_id, image=image
+            ).update(image_hash=image_hash)
+        return [recipe.pk for recipe in created]
+
+    def create_recipe_relations(self, recipe_ids, ingredient_ids, tag_ids,
+                                rng):
+        for batch in batches(recipe_ids, self.batch_size):
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.choice((1, 2, 5, 10, 50, 100, 200, 500))
+                )
+                for recipe_id in batch
+                for ingredient_id in rng.sample(
+                    ingredient_ids, min(rng.randint(3, 12),
+                                        len(ingredient_ids))
+                )
+            ])
+            RecipeTag.objects.bulk_create([
+                RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+                for recipe_id in batch
+                for tag_id in rng.sample(
+                    tag_ids, rng.randint(1, len(tag_ids))
+                )
+            ])
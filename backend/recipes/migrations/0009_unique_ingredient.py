@@ -0,0 +1,52 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicates(apps, schema_editor):
+    # Перед добавлением ограничения сводим дубликаты к одной записи,
+    # переназначая на неё ингредиенты рецептов. Если в рецепте несколько
+    # ингредиентов группы, их количества складываются в одну строку.
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(keep=Min('id'), count=Count('id')).filter(count__gt=1)
+    for duplicate in duplicates:
+        keep = duplicate['keep']
+        extra = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit']
+        ).exclude(id=keep)
+        rows = RecipeIngredient.objects.filter(
+            ingredient_id__in=[keep, *extra.values_list('id', flat=True)]
+        )
+        clashes = rows.values('recipe').annotate(
+            total=Sum('amount'), count=Count('id')
+        ).filter(count__gt=1)
+        for clash in clashes:
+            recipe_rows = rows.filter(recipe_id=clash['recipe'])
+            row = (
+                recipe_rows.filter(ingredient_id=keep).first()
+                or recipe_rows.order_by('id').first()
+            )
+            recipe_rows.exclude(id=row.id).delete()
+            row.ingredient_id = keep
+            row.amount = clash['total']
+            row.save()
+        rows.exclude(ingredient_id=keep).update(ingredient_id=keep)
+        extra.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_ingredient_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 2.2.19 on 2026-10-18 18:48
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_feeds(apps, schema_editor):
+    Follow = apps.get_model('users', 'Follow')
+    FeedItem = apps.get_model('recipes', 'FeedItem')
+    items = Follow.objects.filter(
+        author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+        author__recipes__isnull=False
+    ).values_list(
+        'user_id', 'author__recipes', 'author__recipes__pub_date'
+    ).iterator()
+    batch = []
+    for user_id, recipe_id, pub_date in items:
+        batch.append(FeedItem(
+            user_id=user_id, recipe_id=recipe_id, pub_date=pub_date
+        ))
+        if len(batch) == 1000:
+            FeedItem.objects.bulk_create(batch)
+            batch = []
+    FeedItem.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0015_shoppinglistitem'),
+        ('users', '0003_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата создания рецепта')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='recipes.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed', to=settings.AUTH_USER_MODEL, verbose_name='Владелец ленты')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='feeditem',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feeditem_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feeditem',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_item'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
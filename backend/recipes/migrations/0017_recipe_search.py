@@ -0,0 +1,77 @@
+import django.contrib.postgres.search
+from django.db import migrations
+from django.db.utils import OperationalError
+
+INGREDIENT_NAMES = '''
+    SELECT string_agg(ingredient.name, ' ')
+    FROM recipes_recipeingredient AS recipe_ingredient
+    JOIN recipes_ingredient AS ingredient
+        ON ingredient.id = recipe_ingredient.ingredient_id
+    WHERE recipe_ingredient.recipe_id = recipes_recipe.id
+'''
+
+POSTGRESQL_FORWARD = (
+    'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_idx '
+    'ON recipes_recipe USING gin (search_vector)',
+    f'''UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('russian', coalesce(text, '')), 'B')
+        || setweight(to_tsvector(
+            'russian', coalesce(({INGREDIENT_NAMES}), '')
+        ), 'C')''',
+)
+
+SQLITE_FORWARD = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS recipes_recipe_fts '
+    'USING fts5(name, text, ingredients, '
+    "tokenize = 'unicode61 remove_diacritics 2')",
+    '''INSERT INTO recipes_recipe_fts (rowid, name, text, ingredients)
+    SELECT recipe.id, recipe.name, recipe.text, (
+        SELECT group_concat(ingredient.name, ' ')
+        FROM recipes_recipeingredient AS recipe_ingredient
+        JOIN recipes_ingredient AS ingredient
+            ON ingredient.id = recipe_ingredient.ingredient_id
+        WHERE recipe_ingredient.recipe_id = recipe.id
+    )
+    FROM recipes_recipe AS recipe''',
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRESQL_FORWARD:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        try:
+            schema_editor.execute(SQLITE_FORWARD[0])
+        except OperationalError:
+            # SQLite собран без FTS5: поиск работает по вхождению строки.
+            return
+        schema_editor.execute(SQLITE_FORWARD[1])
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS recipes_recipe_search_vector_idx'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS recipes_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_feeditem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
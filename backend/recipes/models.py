@@ -1,11 +1,114 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+
+from users.models import CounterFieldsMixin, Follow
 
 User = get_user_model()
 
 
-class Recipe(models.Model):
+def count_of(queryset, field):
+    """Подзапрос с количеством строк queryset для OuterRef('pk')."""
+    counts = queryset.filter(
+        **{field: models.OuterRef('pk')}
+    ).order_by().values(field).annotate(count=models.Count('pk'))
+    return Coalesce(
+        models.Subquery(
+            counts.values('count'), output_field=models.IntegerField()
+        ),
+        0
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        """Аннотирует рецепты флагами избранного и списка покупок."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()
+                )
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            )
+        )
+
+    def for_list(self, user):
+        """Рецепты со всеми связанными данными для RecipeListSerializer."""
+        if user.is_anonymous:
+            is_subscribed = models.Value(
+                False, output_field=models.BooleanField()
+            )
+        else:
+            is_subscribed = models.Exists(
+                Follow.objects.filter(
+                    user=user, author=models.OuterRef('pk')
+                )
+            )
+        return self.with_user_flags(user).prefetch_related(
+            models.Prefetch(
+                'author',
+                queryset=User.objects.annotate(is_subscribed=is_subscribed)
+            ),
+            'tags',
+            models.Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+
+
+class ShoppingListManager(models.Manager):
+
+    def refresh(self, users, ingredients):
+        """Пересчитывает суммы ingredients в списках покупок users.
+
+        users и ingredients — списки идентификаторов или подзапросы.
+        """
+        totals = RecipeIngredient.objects.filter(
+            ingredient__in=ingredients,
+            recipe__shopping_cart__user__in=users
+        ).values(
+            'recipe__shopping_cart__user', 'ingredient'
+        ).annotate(total=models.Sum('amount')).order_by()
+        with transaction.atomic():
+            # Параллельные пересчёты одного списка выполняются по очереди:
+            # иначе оба удалят старые строки и вставят новые, и второй
+            # нарушит уникальность (user, ingredient). Порядок блокировки
+            # один для всех, чтобы не было взаимоблокировок.
+            list(User.objects.filter(pk__in=users).order_by(
+                'pk'
+            ).select_for_update().values_list('pk', flat=True))
+            self.filter(user__in=users, ingredient__in=ingredients).delete()
+            self.bulk_create([
+                self.model(
+                    user_id=row['recipe__shopping_cart__user'],
+                    ingredient_id=row['ingredient'],
+                    total_amount=row['total']
+                )
+                for row in totals
+            ])
+
+
+class Recipe(CounterFieldsMixin, models.Model):
     name = models.CharField(
         max_length=200,
         verbose_name='Название рецепта'
@@ -23,6 +126,12 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Изображение рецепта'
     )
+    image_hash = models.CharField(
+        max_length=32,
+        blank=True,
+        editable=False,
+        verbose_name='Хеш обработанного изображения'
+    )
     cooking_time = models.IntegerField(
         validators=[MinValueValidator(1)],
         verbose_name='Время приготовления'
@@ -43,10 +152,38 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата создания рецепта'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения рецепта'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    counter_fields = ('favorites_count',)
 
     class Meta():
 
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -83,6 +220,15 @@ class Ingredient(models.Model):
         verbose_name='Единица измерения ингредиента'
     )
 
+    class Meta:
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
+
     def __str__(self):
         return self.name
 
@@ -100,6 +246,12 @@ class RecipeTag(models.Model):
                 name='unique_tag_for_recipe'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['tag', 'recipe'],
+                name='recipetag_tag_recipe_idx'
+            )
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -166,3 +318,221 @@ class ShoppingCart(models.Model):
                 name='unique_shopping_cart_recipe'
             )
         ]
+
+
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в корзине пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Владелец списка покупок'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.FloatField(
+        verbose_name='Общее количество'
+    )
+
+    objects = ShoppingListManager()
+
+    class Meta:
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+
+
+class FeedManager(models.Manager):
+    """Ленты подписок: разнос при записи и сборка страницы при чтении.
+
+    Рецепты авторов, у которых больше FEED_FANOUT_LIMIT подписчиков, в
+    ленты не разносятся: они читаются из Recipe при сборке страницы.
+    Если у автора стало меньше подписчиков, чем порог, рецепты, вышедшие
+    до этого, в лентах не появятся.
+    """
+
+    batch_size = 1000
+
+    def is_popular(self, author_id):
+        return User.objects.filter(
+            pk=author_id,
+            followers_count__gt=settings.FEED_FANOUT_LIMIT
+        ).exists()
+
+    def fan_out(self, recipe):
+        """Добавляет новый рецепт в ленты подписчиков автора."""
+        if self.is_popular(recipe.author_id):
+            return
+        followers = Follow.objects.filter(
+            author_id=recipe.author_id
+        ).values_list('user_id', flat=True).iterator()
+        self.bulk_insert(
+            self.model(
+                user_id=user_id, recipe_id=recipe.pk,
+                pub_date=recipe.pub_date
+            )
+            for user_id in followers
+        )
+
+    def follow(self, user_id, author_id):
+        """Заполняет ленту рецептами автора после подписки на него."""
+        if self.is_popular(author_id):
+            return
+        recipes = Recipe.objects.filter(
+            author_id=author_id
+        ).values_list('pk', 'pub_date').iterator()
+        self.bulk_insert(
+            self.model(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+            for pk, pub_date in recipes
+        )
+
+    def unfollow(self, user_id, author_id):
+        self.filter(user_id=user_id, recipe__author_id=author_id).delete()
+
+    def rebuild(self):
+        """Заново разносит рецепты по лентам всех подписчиков."""
+        self.all().delete()
+        items = Follow.objects.filter(
+            author__followers_count__lte=settings.FEED_FANOUT_LIMIT,
+            author__recipes__isnull=False
+        ).values_list(
+            'user_id', 'author__recipes', 'author__recipes__pub_date'
+        ).iterator()
+        self.bulk_insert(
+            self.model(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+            for user_id, pk, pub_date in items
+        )
+
+    def bulk_insert(self, items):
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                self.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        if batch:
+            self.bulk_create(batch, ignore_conflicts=True)
+
+    def page(self, user, limit, before=None):
+        """Идентификаторы limit рецептов ленты, опубликованных раньше
+        позиции before = (pub_date, id), от новых к старым.
+
+        Возвращает список пар (pub_date, id). Оба источника читаются
+        по индексу не дальше limit строк.
+        """
+        timeline = self.filter(user=user)
+        popular = Recipe.objects.filter(author__in=Follow.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_LIMIT
+        ).values('author'))
+        if before is not None:
+            pub_date, pk = before
+            timeline = timeline.filter(
+                models.Q(pub_date__lt=pub_date)
+                | models.Q(pub_date=pub_date, recipe_id__lt=pk)
+            )
+            popular = popular.filter(
+                models.Q(pub_date__lt=pub_date)
+                | models.Q(pub_date=pub_date, pk__lt=pk)
+            )
+        positions = set(timeline.order_by(
+            '-pub_date', '-recipe_id'
+        ).values_list('pub_date', 'recipe_id')[:limit])
+        # Рецепты автора, ставшего популярным, могли попасть в ленту раньше.
+        positions.update(popular.order_by(
+            '-pub_date', '-pk'
+        ).values_list('pub_date', 'pk')[:limit])
+        return sorted(positions, reverse=True)[:limit]
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписчика его автора."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Владелец ленты'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата создания рецепта'
+    )
+
+    objects = FeedManager()
+
+    class Meta:
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_item'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feeditem_user_pub_date_idx'
+            )
+        ]
+
+
+class SimilarRecipe(models.Model):
+    """Один из ближайших соседей рецепта по модели рекомендаций."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(
+        verbose_name='Сходство'
+    )
+
+    class Meta:
+
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similarrecipe_recipe_score_idx'
+            )
+        ]
+
+
+class StaleRecommendation(models.Model):
+    """Рецепт, соседей которого нужно пересчитать при частичном обновлении.
+
+    Без внешнего ключа: отметку ставит и каскадное удаление рецепта.
+    """
+
+    recipe_id = models.IntegerField(
+        primary_key=True,
+        verbose_name='Рецепт'
+    )
@@ -0,0 +1,208 @@
+"""Рекомендации рецептов по совместному добавлению в избранное.
+
+Избранное каждого пользователя и его список покупок — две «корзины»
+рецептов с весами 1 и RECOMMENDATION_CART_WEIGHT (0 — список покупок не
+учитывается). Сходство рецептов — косинусная мера между их векторами
+по корзинам; для каждого рецепта хранятся RECOMMENDATION_NEIGHBOURS
+самых похожих.
+
+Полная сборка пересчитывает соседей всех рецептов. Частичная пересчитывает
+рецепты из StaleRecommendation (их избранное менялось) и исправляет их
+оценки в списках соседей остальных рецептов; место, освободившееся в
+таких списках, заполняется при следующей полной сборке.
+"""
+import heapq
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from .models import (Favorite, Recipe, ShoppingCart, SimilarRecipe,
+                     StaleRecommendation)
+
+CHUNK_SIZE = 500
+
+
+def chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def sources():
+    """Модели корзин и веса рецептов в них."""
+    yield Favorite, 1.0
+    if settings.RECOMMENDATION_CART_WEIGHT:
+        yield ShoppingCart, settings.RECOMMENDATION_CART_WEIGHT
+
+
+def load_baskets(users=None):
+    """Корзины пользователей users (None — всех): {(user, источник):
+    {рецепт: вес}}. Из больших корзин берутся последние добавления.
+    """
+    baskets = defaultdict(dict)
+    for source, (model, weight) in enumerate(sources()):
+        rows = model.objects.all()
+        if users is not None:
+            rows = rows.filter(user__in=users)
+        for user_id, recipe_id in rows.order_by(
+            'user', '-pk'
+        ).values_list('user', 'recipe').iterator():
+            basket = baskets[(user_id, source)]
+            if len(basket) < settings.RECOMMENDATION_BASKET_LIMIT:
+                basket[recipe_id] = weight
+    return baskets
+
+
+def squared_norms(recipe_ids=None):
+    """Квадраты длин векторов рецептов по всем корзинам."""
+    norms = defaultdict(float)
+    for model, weight in sources():
+        rows = model.objects.values('recipe').annotate(
+            count=Count('pk')
+        ).order_by()
+        batches = [rows] if recipe_ids is None else (
+            rows.filter(recipe__in=batch) for batch in chunks(recipe_ids)
+        )
+        for batch in batches:
+            for row in batch:
+                norms[row['recipe']] += row['count'] * weight ** 2
+    return norms
+
+
+def co_occurrences(recipe_ids, baskets):
+    """Для каждого рецепта из recipe_ids: {рецепт: скалярное произведение}."""
+    recipe_ids = set(recipe_ids)
+    containing = defaultdict(list)
+    for basket in baskets.values():
+        for recipe_id in basket:
+            if recipe_id in recipe_ids:
+                containing[recipe_id].append(basket)
+    for recipe_id in recipe_ids:
+        products = defaultdict(float)
+        for basket in containing[recipe_id]:
+            weight = basket[recipe_id]
+            for other_id, other_weight in basket.items():
+                if other_id != recipe_id:
+                    products[other_id] += weight * other_weight
+        yield recipe_id, products
+
+
+def similarities(recipe_id, products, norms):
+    return {
+        other_id: product / math.sqrt(norms[recipe_id] * norms[other_id])
+        for other_id, product in products.items()
+    }
+
+
+def top(scores):
+    return heapq.nlargest(
+        settings.RECOMMENDATION_NEIGHBOURS,
+        scores.items(),
+        key=lambda item: (item[1], item[0])
+    )
+
+
+def neighbour_rows(recipe_id, scores):
+    return [
+        SimilarRecipe(recipe_id=recipe_id, similar_id=other_id, score=score)
+        for other_id, score in top(scores)
+    ]
+
+
+def rebuild():
+    """Пересчитывает соседей всех рецептов."""
+    marks = list(StaleRecommendation.objects.values_list('pk', flat=True))
+    baskets = load_baskets()
+    norms = squared_norms()
+    recipe_ids = list(Recipe.objects.values_list('pk', flat=True))
+    with transaction.atomic():
+        SimilarRecipe.objects.all().delete()
+        rows = []
+        for recipe_id, products in co_occurrences(recipe_ids, baskets):
+            rows.extend(neighbour_rows(
+                recipe_id, similarities(recipe_id, products, norms)
+            ))
+            if len(rows) >= CHUNK_SIZE:
+                SimilarRecipe.objects.bulk_create(rows)
+                rows = []
+        SimilarRecipe.objects.bulk_create(rows)
+        # Отметки, появившиеся во время пересчёта, остаются.
+        for batch in chunks(marks):
+            StaleRecommendation.objects.filter(pk__in=batch).delete()
+    return len(recipe_ids)
+
+
+def update():
+    """Пересчитывает соседей рецептов из StaleRecommendation."""
+    marks = list(StaleRecommendation.objects.values_list('pk', flat=True))
+    stale = []
+    for batch in chunks(marks):
+        stale.extend(Recipe.objects.filter(
+            pk__in=batch
+        ).values_list('pk', flat=True))
+    users = set()
+    for model, _ in sources():
+        for batch in chunks(stale):
+            users.update(model.objects.filter(
+                recipe__in=batch
+            ).values_list('user', flat=True))
+    baskets = load_baskets(users)
+    products = dict(co_occurrences(stale, baskets))
+    involved = set(stale)
+    for scores in products.values():
+        involved.update(scores)
+    norms = squared_norms(involved)
+    scores = {
+        recipe_id: similarities(recipe_id, recipe_products, norms)
+        for recipe_id, recipe_products in products.items()
+    }
+    with transaction.atomic():
+        for batch in chunks(stale):
+            SimilarRecipe.objects.filter(recipe__in=batch).delete()
+        SimilarRecipe.objects.bulk_create([
+            row
+            for recipe_id, recipe_scores in scores.items()
+            for row in neighbour_rows(recipe_id, recipe_scores)
+        ])
+        patch_neighbours(stale, scores)
+        for batch in chunks(marks):
+            StaleRecommendation.objects.filter(pk__in=batch).delete()
+    return len(stale)
+
+
+def patch_neighbours(stale, scores):
+    """Подставляет новые оценки рецептов stale в списки соседей
+    остальных рецептов.
+    """
+    stale = set(stale)
+    affected = set()
+    for recipe_scores in scores.values():
+        affected.update(recipe_scores)
+    for batch in chunks(stale):
+        affected.update(SimilarRecipe.objects.filter(
+            similar__in=batch
+        ).values_list('recipe', flat=True))
+    affected -= stale
+    # Сходство симметрично: оценки рецептов stale с точки зрения соседа.
+    reverse = defaultdict(dict)
+    for stale_id, recipe_scores in scores.items():
+        for recipe_id, score in recipe_scores.items():
+            reverse[recipe_id][stale_id] = score
+    for batch in chunks(affected):
+        current = defaultdict(dict)
+        for recipe_id, other_id, score in SimilarRecipe.objects.filter(
+            recipe__in=batch
+        ).values_list('recipe', 'similar', 'score'):
+            if other_id not in stale:
+                current[recipe_id][other_id] = score
+        for recipe_id in batch:
+            current[recipe_id].update(reverse[recipe_id])
+        SimilarRecipe.objects.filter(recipe__in=batch).delete()
+        SimilarRecipe.objects.bulk_create([
+            row
+            for recipe_id in batch
+            for row in neighbour_rows(recipe_id, current[recipe_id])
+        ])
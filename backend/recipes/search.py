@@ -0,0 +1,143 @@
+"""Полнотекстовый поиск рецептов.
+
+PostgreSQL: столбец Recipe.search_vector с GIN-индексом, конфигурация
+russian; вес названия — A, описания — B, названий ингредиентов — C.
+SQLite: виртуальная таблица FTS5 с теми же полями, веса передаются в bm25.
+На остальных СУБД — поиск вхождения в название и описание без ранжирования.
+"""
+import re
+
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import (F, FloatField, OuterRef, Q, Subquery,
+                              TextField)
+from django.db.models.expressions import RawSQL
+
+from .models import Recipe, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+
+FTS_TABLE = 'recipes_recipe_fts'
+
+# Соотношение весов A, B и C по умолчанию в ts_rank.
+FTS_WEIGHTS = (1.0, 0.4, 0.2)
+
+FTS_MATCH = f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s'
+
+FTS_RANK = (
+    f'SELECT bm25({FTS_TABLE}, {", ".join(map(str, FTS_WEIGHTS))}) '
+    f'FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+    f'AND rowid = {Recipe._meta.db_table}.id'
+)
+
+FTS_INSERT = f'''
+    INSERT INTO {FTS_TABLE} (rowid, name, text, ingredients)
+    SELECT recipe.id, recipe.name, recipe.text, (
+        SELECT group_concat(ingredient.name, ' ')
+        FROM recipes_recipeingredient AS recipe_ingredient
+        JOIN recipes_ingredient AS ingredient
+            ON ingredient.id = recipe_ingredient.ingredient_id
+        WHERE recipe_ingredient.recipe_id = recipe.id
+    )
+    FROM recipes_recipe AS recipe
+'''
+
+_fts_ready = set()
+
+
+class InSubquery(RawSQL):
+    """Подзапрос SQL для фильтра pk__in.
+
+    Lookup сам берёт правую часть в скобки; RawSQL добавил бы ещё одни,
+    и IN ((SELECT ...)) сравнивал бы только с первой строкой подзапроса.
+    """
+
+    def as_sql(self, compiler, connection):
+        return self.sql, self.params
+
+
+def has_fts():
+    """Создана ли таблица FTS5: её нет, если SQLite собран без FTS5."""
+    if connection.alias not in _fts_ready:
+        if FTS_TABLE in connection.introspection.table_names():
+            _fts_ready.add(connection.alias)
+    return connection.alias in _fts_ready
+
+
+def search_vector():
+    # Модуль агрегатов требует psycopg2, которого может не быть на SQLite.
+    from django.contrib.postgres.aggregates import StringAgg
+
+    ingredients = Subquery(
+        RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names'),
+        output_field=TextField()
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(ingredients, weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_index(recipe_ids=None):
+    """Обновляет поисковый индекс рецептов recipe_ids (None — всех).
+
+    Удалённые рецепты из индекса убираются.
+    """
+    if connection.vendor == 'postgresql':
+        recipes = Recipe.objects.all()
+        if recipe_ids is not None:
+            recipes = recipes.filter(pk__in=recipe_ids)
+        recipes.update(search_vector=search_vector())
+    elif connection.vendor == 'sqlite' and has_fts():
+        with connection.cursor() as cursor:
+            if recipe_ids is None:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+                cursor.execute(FTS_INSERT)
+                return
+            recipe_ids = list(recipe_ids)
+            placeholders = ', '.join(['%s'] * len(recipe_ids))
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                recipe_ids
+            )
+            cursor.execute(
+                f'{FTS_INSERT} WHERE recipe.id IN ({placeholders})',
+                recipe_ids
+            )
+
+
+def fts_query(value):
+    """Запрос FTS5: все слова обязательны, каждое — как префикс.
+
+    Префиксы заменяют стемминг, которого в FTS5 для русского языка нет.
+    """
+    words = re.findall(r'\w+', value.lower())
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_recipes(queryset, value):
+    """Рецепты, найденные по запросу value, от более релевантных."""
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(value, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-pub_date', '-id')
+    if connection.vendor == 'sqlite' and has_fts():
+        match = fts_query(value)
+        if not match:
+            return queryset.none()
+        # bm25 возвращает тем меньшее число, чем выше релевантность.
+        return queryset.filter(
+            pk__in=InSubquery(FTS_MATCH, [match])
+        ).annotate(
+            rank=RawSQL(FTS_RANK, [match], output_field=FloatField())
+        ).order_by('rank', '-pub_date', '-id')
+    return queryset.filter(
+        Q(name__icontains=value) | Q(text__icontains=value)
+    )
@@ -0,0 +1,152 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import Signal, receiver
+
+from users.models import Follow
+from .images import schedule_recipe_image
+from .models import (Favorite, FeedItem, Recipe, RecipeIngredient,
+                     ShoppingCart, ShoppingListItem, StaleRecommendation)
+from .search import update_search_index
+
+User = get_user_model()
+
+# Отправляется после массовой записи объектов модели sender в обход её
+# сигналов (bulk_create, COPY), например командами manage.py.
+bulk_loaded = Signal()
+
+
+@receiver(pre_save, sender=Recipe)
+def reset_image_hash(sender, instance, **kwargs):
+    # Новый файл ещё не сохранён в хранилище: старые варианты не подходят.
+    if instance.image and not instance.image._committed:
+        instance.image_hash = ''
+
+
+@receiver(post_save, sender=Recipe)
+def process_image(sender, instance, **kwargs):
+    if instance.image and not instance.image_hash:
+        transaction.on_commit(lambda: schedule_recipe_image(instance.pk))
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    User.objects.filter(
+        pk=instance.author_id, recipes_count__gt=0
+    ).update(recipes_count=F('recipes_count') - 1)
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorites_count(sender, instance, **kwargs):
+    Recipe.objects.filter(
+        pk=instance.recipe_id, favorites_count__gt=0
+    ).update(favorites_count=F('favorites_count') - 1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def refresh_cart_owner_list(sender, instance, **kwargs):
+    if kwargs.get('created') is False:
+        # Повторное сохранение строки корзины список не меняет.
+        return
+    ShoppingListItem.objects.refresh(
+        [instance.user_id],
+        RecipeIngredient.objects.filter(
+            recipe_id=instance.recipe_id
+        ).values('ingredient')
+    )
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def refresh_cart_lists(sender, instance, **kwargs):
+    ShoppingListItem.objects.refresh(
+        ShoppingCart.objects.filter(
+            recipe_id=instance.recipe_id
+        ).values('user'),
+        [instance.ingredient_id]
+    )
+
+
+@receiver(pre_delete, sender=Recipe)
+def remember_cart_lists(sender, instance, **kwargs):
+    # При каскадном удалении строки корзины и ингредиенты рецепта удаляются
+    # в произвольном порядке: списки пересчитываются после удаления рецепта.
+    instance._cart_lists = (
+        list(ShoppingCart.objects.filter(
+            recipe=instance
+        ).values_list('user', flat=True)),
+        list(RecipeIngredient.objects.filter(
+            recipe=instance
+        ).values_list('ingredient', flat=True))
+    )
+
+
+@receiver(post_delete, sender=Recipe)
+def refresh_deleted_recipe_lists(sender, instance, **kwargs):
+    users, ingredients = getattr(instance, '_cart_lists', ([], []))
+    if users and ingredients:
+        ShoppingListItem.objects.refresh(users, ingredients)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        FeedItem.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def fill_feed(sender, instance, created, **kwargs):
+    if created:
+        FeedItem.objects.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def clear_feed(sender, instance, **kwargs):
+    FeedItem.objects.unfollow(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def index_recipe(sender, instance, **kwargs):
+    update_search_index([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def index_recipe_ingredients(sender, instance, **kwargs):
+    update_search_index([instance.recipe_id])
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def mark_stale_recommendation(sender, instance, **kwargs):
+    if kwargs.get('created') is False:
+        return
+    if sender is ShoppingCart and not settings.RECOMMENDATION_CART_WEIGHT:
+        return
+    StaleRecommendation.objects.bulk_create(
+        [StaleRecommendation(recipe_id=instance.recipe_id)],
+        ignore_conflicts=True
+    )